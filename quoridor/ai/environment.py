@@ -0,0 +1,101 @@
+import numpy
+
+from quoridor.core.game import InvalidMove, mask_to_actions
+from quoridor.core.context import QuoridorContext
+from quoridor.ai.utils import (
+    calculate_input_size,
+    input_vector_from_game_state,
+)
+
+
+class VectorEnvironment(object):
+    """
+    Runs ``count`` games in lockstep, every ``step`` plays one action in
+    each of them. Finished games are recorded in ``finished`` as
+    ``(start_state, history, winner)`` and started again right away.
+
+    ``start_state`` is an optional callable returning the state for a new
+    game, ``None`` from it (or no callable) means the initial state.
+    """
+
+    def __init__(self, game, count, start_state=None, repeat=1):
+        self.game = game
+        self.count = count
+        self.start_state = start_state
+        self.repeat = repeat
+        self.input_size = calculate_input_size(repeat)
+        self.contexts = [QuoridorContext(game) for i in range(count)]
+        self.finished = []
+        for index in range(count):
+            self.reset(index)
+
+    def reset(self, index):
+        state = self.start_state() if self.start_state else None
+        self.contexts[index].reset(state=state)
+
+    @property
+    def states(self):
+        return [context.state for context in self.contexts]
+
+    @property
+    def players(self):
+        return numpy.array([context.state[0] for context in self.contexts])
+
+    def observations(self):
+        """Input vectors of all games as rows of one array."""
+        observations = numpy.empty((self.count, self.input_size))
+        for index, context in enumerate(self.contexts):
+            observations[index] = list(
+                input_vector_from_game_state(context, repeat=self.repeat)
+            )
+        return observations
+
+    def legal_masks(self):
+        masks = numpy.zeros((self.count, self.game.all_moves), dtype=bool)
+        for index, context in enumerate(self.contexts):
+            legal = context.legal_actions
+            masks[index, mask_to_actions(legal)] = True
+        return masks
+
+    def greedy_actions(self, values, masks=None):
+        """Legal action with the highest value in every row of values."""
+        masks = self.legal_masks() if masks is None else masks
+        values = numpy.where(masks, values, -numpy.inf)
+        return values.argmax(axis=1)
+
+    def step(self, actions):
+        """
+        Plays ``actions[i]`` in game ``i``. Returns arrays of rewards for
+        the players who moved, 1 for a winning move and 0 otherwise, and
+        of flags for the games that finished and were started again.
+
+        All actions are checked before any game moves, so ``InvalidMove``
+        for one of them leaves every game as it was.
+        """
+        assert len(actions) == self.count
+        actions = [int(action) for action in actions]
+        for index, (context, action) in enumerate(zip(self.contexts,
+                                                      actions)):
+            if not (0 <= action < self.game.all_moves and
+                    context.legal_actions >> action & 1):
+                raise InvalidMove(
+                    'Invalid action {action} in game {index}!'.format(
+                        action=action, index=index,
+                    )
+                )
+
+        rewards = numpy.zeros(self.count)
+        done = numpy.zeros(self.count, dtype=bool)
+        for index, (context, action) in enumerate(zip(self.contexts,
+                                                      actions)):
+            context.update(action)
+            if context.is_terminal:
+                self.finished.append((
+                    context['start_state'],
+                    list(context.history),
+                    context.winner,
+                ))
+                rewards[index] = 1
+                done[index] = True
+                self.reset(index)
+        return rewards, done
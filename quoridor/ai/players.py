@@ -28,6 +28,7 @@ from quoridor.core.game import (
     PAWN_MOVE_PATHS,
 
     InvalidMove,
+    mask_to_actions,
 )
 
 
@@ -115,50 +116,36 @@ class HumanPlayer(Player):
 
 
 class PathPlayer(Player):
-    def move_pawn(self, new_state, context, player, next_):
-        current_position = context[player]['path'].pop()
-        new_position = context[player]['path'][-1]
-        if new_position == new_state[1 + next_]:
-            if len(context[player]['path']) > 1:    # jump
-                context[player]['path'].pop()
-                new_position = context[player]['path'][-1]
-            else: # opponent occupies final position
-                final = context[player]['path'][-1]
-                new_path = self.game.shortest_path(
-                    new_state, player, set([final])
-                )
-                if new_path is None or len(new_path) != 3:
-                    context[player]['path'].append(current_position)
-                    if player == YELLOW:
-                        new_position = (
-                            current_position + self.game.move_deltas[UP]
-                        )
-                    else:
-                        new_position = (
-                            current_position + self.game.move_deltas[DOWN]
-                        )
-                    context[player]['path'].append(new_position)
-                else:   # ok to finish
-                    new_position = new_path[0]
-
-        move = self.game.delta_moves[new_position - current_position]
-
-        context.history.append(self.game.wall_moves + move)
-        context[player]['goal_cut'].clear()
-        context[player]['blockers'] = self.game.path_blockers(
-            context[player]['path'],
-            context['crossers'],
-            context[player]['goal_cut']
-        )
-        new_state[1 + player] = new_position
-        new_state[0] = next_
-
-    def play(self, context):
+    def move_pawn(self, context):
         player = context.state[0]
         next_ = FOLLOWING_PLAYER[player]
-        new_state = list(context.state)
-        self.move_pawn(new_state, context, player, next_)
-        context['state'] = tuple(new_state)
+        path = context[player].path
+        current_position = path[-1]
+        new_position = path[-2]
+        if new_position == context.state[1 + next_]:
+            # opponent is in the way, plan real moves around or over it
+            pawn_path = self.game.pawn_path(context.state, player)
+            if pawn_path is not None:
+                new_position = pawn_path[-2]
+            elif player == YELLOW:
+                new_position = current_position + self.game.move_deltas[UP]
+            else:
+                new_position = current_position + self.game.move_deltas[DOWN]
+
+        move = self.game.delta_moves.get(new_position - current_position)
+        if move is None or not self.game.is_valid_pawn_move(
+                context.state, move):
+            # planned move is blocked, take any possible pawn move
+            pawn_moves = self.game.pawn_moves_mask(
+                self.game.walls_mask(context.state[5]),
+                current_position,
+                context.state[1 + FOLLOWING_PLAYER[context.state[0]]],
+            )
+            move = mask_to_actions(pawn_moves)[0]
+        context.update(self.game.wall_moves + move, checks_on=False)
+
+    def play(self, context):
+        self.move_pawn(context)
 
 
 class RandomPlayerWithPath(PathPlayer):
@@ -170,12 +157,8 @@ class RandomPlayerWithPath(PathPlayer):
         if random.random() > self.randomness:
             super(RandomPlayerWithPath, self).play(context)
             return
-        while True:
-            try:
-                context.update(random.choice(list((context.game.all_actions))))
-                break
-            except InvalidMove:
-                pass
+        legal = context.legal_actions
+        context.update(random.choice(mask_to_actions(legal)))
 
 
 
@@ -185,10 +168,13 @@ class HeuristicPlayer(PathPlayer):
         self.pawn_moves = pawn_moves
 
     def good_blockers(self, context, player, next_):
-        for action in context[next_]['blockers']:
-            if action not in context[player]['blockers']:
-                if action not in context['crossers']:
-                    if action not in context[next_]['goal_cut']:
+        blocked = context.blocked
+        goal_cut = context[next_].goal_cut | context[player].goal_cut
+        player_blockers = context[player].blockers
+        for action in context[next_].blockers:
+            if action not in player_blockers:
+                if not blocked >> action & 1:
+                    if action not in goal_cut:
                         yield action
 
     def should_move(self, context):
@@ -197,45 +183,42 @@ class HeuristicPlayer(PathPlayer):
         next_ = FOLLOWING_PLAYER[player]
         if not context.state[3 + player]:
             return True     # no walls left
-        elif len(context[player]['path']) == 2:
+        elif len(context[player].path) == 2:
             return True     # last winning move
         elif context.state[1 + player] in self.game.goal_positions[next_]:
             return True     # on the first line is probably the beginning
-        elif len(context[next_]['blockers']) > 2:
+        elif len(context[next_].blockers) > 2:
             # has enough time to block at least once in the future
             return random.random() < self.pawn_moves
         else:
             # probably one of the last changes to block
             return False
 
-    def _try_good_wall(self, state, temp_state, context, action):
-        next_ = FOLLOWING_PLAYER[state[0]]
-        temp_state[5].add(action)
-        new_opponent_path = self.game.shortest_path(temp_state, next_)
-        if new_opponent_path is None:
-            temp_state[5].remove(action)
-            context[next_]['goal_cut'].add(action)
-            return False
+    def _try_good_wall(self, context, action):
         # TODO: may be better if played only when making opponents path longer
-        state[5] = frozenset(temp_state[5])
-        state[3 + state[0]] -= 1
-        context[next_]['path'] = new_opponent_path
-        new_crossers = self.game.wall_crossers(action)
-        context['crossers'] = context['crossers'].union(new_crossers)
-        context[next_]['blockers'] = self.game.path_blockers(
-            new_opponent_path,
-            context['crossers'],
-            context[next_]['goal_cut']
-        )
-        state[0] = next_
-        context['history'].append(action)
+        state = context.state
+        walls = self.game.walls_mask(state[5])
+        if self.game.closes_wall_loop(walls, action):
+            # only walls closing a loop can cut a pawn off, probe them
+            # without touching the context
+            new_walls = walls | 1 << action
+            cut_colors = [
+                color for color in (YELLOW, GREEN)
+                if not self.game.can_reach_goal(
+                    new_walls, color, state[1 + color]
+                )
+            ]
+            if cut_colors:
+                for color in cut_colors:
+                    context[color].goal_cut.add(action)
+                return False
+        context.update(action, checks_on=False)
         return True
 
     def play(self, context):
         """
         choose between shortest path and wall
         updates context for effectiveness with action played
-        and returns new_state
 
         context can be initialized with make_context
         """
@@ -243,18 +226,14 @@ class HeuristicPlayer(PathPlayer):
 
         player = context.state[0]
         next_ = FOLLOWING_PLAYER[player]
-        new_state = list(context.state)
 
         if not self.should_move(context):  # try place good wall
-            temp_state = new_state[:5] + [set(new_state[5])]
             for action in self.good_blockers(context, player, next_):
-                if self._try_good_wall(new_state, temp_state, context, action):
-                    context['state'] = tuple(new_state)
+                if self._try_good_wall(context, action):
                     return
             # TODO: is there something more to try?
 
-        self.move_pawn(new_state, context, player, next_)
-        context['state'] = tuple(new_state)
+        self.move_pawn(context)
 
 
 class NetworkPlayer(Player):
@@ -346,10 +325,9 @@ class QlearningNetworkPlayer(NetworkPlayer):
             choose_from = self._choose_random()
         else:
             choose_from = self._choose_from_activations()
+        legal = context.legal_actions
         for action in choose_from:
-            try:
+            # TODO: add illegal actions to desired output with bad reward?
+            if legal >> action & 1:
                 context.update(action)
                 break
-            except InvalidMove:
-                # TODO: add to desired output vector with bad reward?
-                pass
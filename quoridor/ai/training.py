@@ -7,7 +7,12 @@ from contextlib import closing
 
 from quoridor.commonsettings import DB_PATH
 from quoridor.db.utils import make_db_session, db_save_game
-from quoridor.core.game import YELLOW, GREEN, GameException
+from quoridor.core.game import (
+    YELLOW,
+    GREEN,
+    GameException,
+    mask_to_actions,
+)
 
 
 TRAINING_STATES = {
@@ -216,10 +221,9 @@ def play_game(context):
                 qlnn.perceptron.propagate_backward(activations, desired)
             explore = qlnn.perceptron.exploration_probability
             if explore and explore > random.random():
-                invalid_actions = set(context.invalid_actions)
+                legal = context.legal_actions
                 qlnn.explore = True
-                choices = context.game.all_actions - invalid_actions
-                qlnn.random_choose_from = choices
+                qlnn.random_choose_from = mask_to_actions(legal)
             context[player]['player'](context)
             activations = qlnn.activations
             last_qlnn_action = context.last_action
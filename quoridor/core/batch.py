@@ -0,0 +1,90 @@
+import numpy
+
+from quoridor.core.game import YELLOW, GREEN, UP, RIGHT, DOWN, LEFT
+
+
+_STEP_TABLES = {}
+
+
+def _make_step_tables(game):
+    """
+    For every step direction the two walls blocking it from each square
+    as ``(board_size, board_size)`` index arrays. Index ``game.wall_moves``
+    stands for a missing wall, also used for steps off the board.
+    """
+    tables = _STEP_TABLES.get(game.board_size)
+    if tables is None:
+        tables = []
+        shape = (game.board_size, game.board_size)
+        for move in (UP, RIGHT, DOWN, LEFT):
+            first_walls = numpy.full(shape, game.wall_moves, numpy.intp)
+            second_walls = first_walls.copy()
+            for position in range(game.board_positions):
+                walls = game.blocker_walls[4 * position + move]
+                if walls is None:
+                    continue
+                row, col = divmod(position, game.board_size)
+                walls = tuple(walls) + (game.wall_moves, ) * (2 - len(walls))
+                first_walls[row, col], second_walls[row, col] = walls
+            tables.append((first_walls, second_walls))
+        _STEP_TABLES[game.board_size] = tables
+    return tables
+
+
+def batch_distances(game, packed):
+    """
+    Distances to goal of both players for packed states (rows made by
+    ``game.pack`` or ``pack_states``), an int array of shape ``(len, 2)``
+    with -1 for a pawn cut off from its goal.
+
+    For each player the area reached from the goal row grows one step at a
+    time in all states together. States where the pawn got reached or the
+    area stopped growing are dropped from the batch.
+    """
+    packed = numpy.asarray(packed, dtype=numpy.uint8)
+    assert packed.ndim == 2 and packed.shape[1] == game.packed_size
+    size = game.board_size
+    count = len(packed)
+    walls = numpy.zeros((count, game.wall_moves + 1), dtype=bool)
+    walls[:, :game.wall_moves] = numpy.unpackbits(
+        packed[:, 5:], axis=1
+    )[:, :game.wall_moves]
+    up, right, down, left = [
+        ~(walls[:, first] | walls[:, second])
+        for first, second in _make_step_tables(game)
+    ]
+
+    distances = numpy.full((count, 2), -1, dtype=numpy.int32)
+    for player in (YELLOW, GREEN):
+        positions = packed[:, 1 + player].astype(numpy.intp)
+        rows, cols = positions // size, positions % size
+        goal_row = size - 1 if player == YELLOW else 0
+        reached = numpy.zeros((count, size, size), dtype=bool)
+        reached[:, goal_row, :] = True
+        distances[rows == goal_row, player] = 0
+        indices = numpy.arange(count)
+        active = numpy.flatnonzero(rows != goal_row)
+        steps = (up, right, down, left)
+        distance = 0
+        while len(active):
+            if len(active) < len(indices):
+                indices = indices[active]
+                rows, cols = rows[active], cols[active]
+                reached = reached[active]
+                steps = [step[active] for step in steps]
+            distance += 1
+            up_steps, right_steps, down_steps, left_steps = steps
+            new_reached = reached.copy()
+            new_reached[:, 1:, :] |= reached[:, :-1, :] & up_steps[:, 1:, :]
+            new_reached[:, :-1, :] |= (
+                reached[:, 1:, :] & down_steps[:, :-1, :])
+            new_reached[:, :, :-1] |= (
+                reached[:, :, 1:] & right_steps[:, :, :-1])
+            new_reached[:, :, 1:] |= reached[:, :, :-1] & left_steps[:, :, 1:]
+
+            hits = new_reached[numpy.arange(len(indices)), rows, cols]
+            distances[indices[hits], player] = distance
+            grown = (new_reached != reached).any(axis=(1, 2))
+            reached = new_reached
+            active = numpy.flatnonzero(grown & ~hits)
+    return distances
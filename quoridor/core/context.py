@@ -1,14 +1,16 @@
-import itertools
-
 from quoridor.core.game import (
     YELLOW,
     GREEN,
+    UP,
+    RIGHT,
+    DOWN,
+    LEFT,
     PLAYER_COLOR_NAME,
     FOLLOWING_PLAYER,
-    ANTI_MOVE,
-    PAWN_MOVE_PATHS,
     InvalidMove,
+    mask_to_actions,
 )
+from quoridor.core.distances import DistanceMap
 
 
 CONTEXT_FMT = '''\
@@ -16,143 +18,350 @@ state: {state}
 history: {history}
 yellow: {yellow}
 green: {green}
-crossers({cross_num}): {crossers}
+blocked({blocked_num}): {blocked}
 '''
 
 
+class PlayerRecord(object):
+    """
+    Per-player part of the context. Item access maps to the attributes,
+    so ``record['path']`` is the same as ``record.path``.
+
+    Placed walls are only queued and put into the distance map when
+    ``distances`` is read, paths are searched directly meanwhile.
+    """
+
+    FIELDS = (
+        'name', 'player', 'path', 'blockers', 'goal_cut', 'distances', 'color',
+    )
+    __slots__ = (
+        'name', 'player', 'path', 'blockers', 'goal_cut', 'color',
+        '_distances', '_shared_distances', '_pending', '_changes',
+    )
+
+    def __init__(self, color, distances, path, blockers, name='',
+                 player=None):
+        self.name = name
+        self.player = player
+        self.path = path
+        self.blockers = blockers
+        # walls cutting the player off the goal, kept until a pawn move
+        # crosses the boundary they would block
+        self.goal_cut = set()   # TODO: consider using ordered set
+        self.distances = distances
+        self.color = color
+
+    @property
+    def distances(self):
+        if self._pending:
+            self._flush()
+        return self._distances
+
+    @distances.setter
+    def distances(self, distances):
+        self._distances = distances
+        self._shared_distances = False
+        self._pending = []  # placed walls not yet in the distance map
+        self._changes = []  # (wall, changes) of walls put into the map
+
+    def fork(self):
+        """
+        Copy of the record sharing the distance map until one of the
+        records places or removes a wall. Blockers are only ever replaced,
+        never changed in place, so the set is shared as it is.
+        """
+        record = PlayerRecord(
+            self.color,
+            self._distances,
+            list(self.path) if self.path is not None else None,
+            self.blockers,
+            name=self.name,
+            player=self.player,
+        )
+        record.goal_cut = set(self.goal_cut)
+        record._pending = list(self._pending)
+        self._shared_distances = record._shared_distances = True
+        return record
+
+    def _own_distances(self):
+        if self._shared_distances:
+            self._distances = self._distances.copy()
+            self._shared_distances = False
+        return self._distances
+
+    def _flush(self):
+        distances = self._own_distances()
+        for wall in self._pending:
+            self._changes.append((wall, distances.place_wall(wall)))
+        self._pending = []
+
+    def _remove_wall(self, wall):
+        """Takes back the latest placed ``wall``."""
+        if self._pending:
+            assert self._pending.pop() == wall
+            return
+        placed, changes = self._changes.pop()
+        assert placed == wall
+        self._own_distances().restore(wall, changes)
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __repr__(self):
+        return repr(dict(
+            (attr, getattr(self, attr)) for attr in self.FIELDS
+        ))
+
+
 class QuoridorContext(object):
+    __slots__ = (
+        'game', 'state', 'start_state', 'key', 'history', 'blocked',
+        '_players', '_deltas', '_legal',
+    )
+
     def __init__(self, game, **kwargs):
         self.game = game
-        self._data = dict()
+        self.state = self.start_state = self.key = None
+        self.history = []
+        self._deltas = []
+        self.blocked = 0
+        self._players = [None, None]
+        self._legal = None
 
     def reset(self, state=None, players=None):
         state = state if state else self.game.initial_state()
         players = players if players else {YELLOW: {}, GREEN: {}}
-        self._data['state'] = state
-        self._data['start_state'] = state
-        self._data['history'] = []
-        self._data['crossers'] = self.game.crossing_actions(state)
+        self.state = state
+        self.start_state = state
+        self.key = self.game.state_key(state)
+        self.history = []
+        self._deltas = []
+        self._legal = None
+        self.blocked = self.game.crossing_mask(state[5])
         for color in (YELLOW, GREEN):
-            path = self.game.shortest_path(state, color)
+            distances = DistanceMap(self.game, state[5], color)
+            path = distances.path(state[1 + color])
             color_name = PLAYER_COLOR_NAME[color]
             assert path is not None, 'no path to goal for ' + color_name
-            blockers = self.game.path_blockers(path, self._data['crossers'])
-            self._data[color] = {
-                'name': players[color].get('name', ''),
-                'player': players[color].get('player', None),
-                'path': path,
-                'blockers': blockers,
-                'goal_cut': set(),  # TODO: consider using ordered set
-                'color': color,
-            }
+            self._players[color] = PlayerRecord(
+                color,
+                distances,
+                path,
+                self.game.path_blockers(path, self.blocked),
+                name=players[color].get('name', ''),
+                player=players[color].get('player', None),
+            )
+
+    def fork(self):
+        """
+        Independent context continuing from the current state, for trying
+        out moves without touching this one. Immutable parts are shared,
+        distance maps only until a wall is placed or taken back in either
+        context. The fork cannot undo moves played before it was made.
+        """
+        context = QuoridorContext(self.game)
+        context.state = self.state
+        context.start_state = self.start_state
+        context.key = self.key
+        context.history = list(self.history)
+        context.blocked = self.blocked
+        context._legal = self._legal
+        context._players = [record.fork() for record in self._players]
+        return context
+
+    def _find_path(self, record):
+        """
+        Shortest path of the player to its goal. The distance map gives it
+        cheaply when up to date, otherwise a search is cheaper than
+        putting the queued walls into the map.
+        """
+        if record._pending:
+            return self.game.shortest_path(self.state, record.color)
+        return record._distances.path(self.state[1 + record.color])
+
+    def _update_path(self, record, path, avoid=None):
+        record.path = path
+        if path is None:    # goal cut off, possible only with checks off
+            record.blockers = set()
+            return
+        record.blockers = self.game.path_blockers(path, self.blocked, avoid)
 
     def undo(self):
-        action = self.last_action
-        if action is None or not (0 <= action < self.game.all_moves):
+        if not self._deltas:
             raise InvalidMove('Cannot undo!')
-        new_state = list(self.state)
-        current_player = new_state[0]
-        previous_player = FOLLOWING_PLAYER[current_player]
-        new_state[0] = previous_player
-        if 0 <= action < self.game.wall_moves:
-            if not new_state[5] or action not in new_state[5]:
-                raise InvalidMove('Cannot undo!')
-            new_state[3 + previous_player] += 1
-            new_state[5] = new_state[5].difference((action, ))
-            for color in (YELLOW, GREEN):
-                self._data['crossers'] = self.game.crossing_actions(new_state)
-                path = self.game.shortest_path(new_state, color)
-                blockers = self.game.path_blockers(path, self._data['crossers'])
-                self._data[color]['blockers'] = blockers
-                self._data[color]['path'] = path
-                self._data[color]['goal_cut'].clear()
-        else:
-            move = action - self.game.wall_moves
-            anti_move = ANTI_MOVE[move]
-            if not self.game.is_valid_pawn_move(new_state, anti_move):
-                raise InvalidMove('Cannot undo!')
-            new_state[1 + previous_player] += sum([
-                self.game.move_deltas[pawn_move]
-                for pawn_move in PAWN_MOVE_PATHS[anti_move][0]
-            ])
-            path = self.game.shortest_path(new_state, previous_player)
-            blockers = self.game.path_blockers(path, self._data['crossers'])
-            self._data[previous_player]['blockers'] = blockers
-            self._data[previous_player]['path'] = path
-            self._data[previous_player]['goal_cut'].clear()
-        self._data['history'].pop()
-        self._data['state'] = tuple(new_state)
+        (self.state, self.key, self.blocked, self._legal,
+         entries) = self._deltas.pop()
+        action = self.history.pop()
+        for record, path, tail, blockers, goal_cut, wall in entries:
+            if tail:
+                path.extend(reversed(tail))
+            record.path = path
+            record.blockers = blockers
+            record.goal_cut = goal_cut
+            if wall:
+                record._remove_wall(action)
 
     def update(self, action, checks_on=True):
+        """
+        Plays ``action`` and pushes what it changed on the undo stack, so
+        ``undo`` restores the previous context without recomputing it.
+        """
         assert not self.is_terminal
-        player = self.state[0]
-        if checks_on:
-            state = self.game.execute_action(self.state, action)
-        else:
-            state = self.game.execute_action(self.state, action, False, False)
+        previous_state = self.state
+        player = previous_state[0]
+        legal = self._legal
+        if checks_on and not (legal is not None
+                              and 0 <= action < self.game.all_moves
+                              and legal >> action & 1):
+            state = self.game.execute_action(previous_state, action)
+        else:   # already known to be legal
+            state = self.game.execute_action(previous_state, action,
+                                             False, False)
 
-        self._data['history'].append(action)
-        self._data['state'] = state
-        if self.is_terminal:
-            self._data[player]['path'] = [state[1 + player]]
-            return
+        previous = previous_state, self.key, self.blocked, legal
+        self._legal = None
+        self.key ^= self.game.key_delta(previous_state, action)
+        self.history.append(action)
+        self.state = state
 
         if 0 <= action < self.game.wall_moves:  # wall
-            new_crossers = self.game.wall_crossers(action)
-            self._data['crossers'] = self._data['crossers'].union(new_crossers)
-            for color in (YELLOW, GREEN):
-                if action in self._data[color]['blockers']:
-                    path = self.game.shortest_path(state, color)
-                    self._data[color]['path'] = path
-                    self._data[color]['blockers'] = self.game.path_blockers(
-                        path,
-                        self._data['crossers'],
-                        self._data[color]['goal_cut']
+            self.blocked |= self.game.crosser_masks[action]
+            entries = []
+            for record in self._players:
+                entries.append((
+                    record,
+                    record.path,
+                    None,
+                    record.blockers,
+                    record.goal_cut,
+                    True,
+                ))
+                record._pending.append(action)
+                # walls cutting the goal off still do so with one more wall,
+                # but the copy must not leak new ones back on undo
+                record.goal_cut = set(record.goal_cut)
+                if action in record.blockers or action in record.goal_cut:
+                    self._update_path(
+                        record,
+                        self._find_path(record),
+                        record.goal_cut,
                     )
+            self._deltas.append(previous + (entries, ))
             return state
 
-        path = self._data[player]['path']
-        if path[-2] == state[1 + player]:   # one step along the path
-            path.pop()
-        elif len(path) > 2 and path[-3] == state[1 + player]:  # jump
-            path.pop()
-            path.pop()
+        record = self._players[player]
+        path = record.path
+        position = state[1 + player]
+        tail = None     # positions popped from the path kept in place
+        if self.is_terminal:
+            new_path = [position]
+        elif path[-2] == position:  # one step along the path
+            tail = [path.pop()]
+            new_path = path
+        elif len(path) > 2 and path[-3] == position:  # jump
+            tail = [path.pop(), path.pop()]
+            new_path = path
         else:
-            # TODO: can this be optimized?
-            self._data[player]['path'] = self.game.shortest_path(state, player)
-
-        self._data[player]['goal_cut'].clear()
-        self._data[player]['blockers'] = self.game.path_blockers(
-            self._data[player]['path'],
-            self._data['crossers'],
-            self._data[player]['goal_cut']
+            new_path = self._find_path(record)
+        self._deltas.append(previous + ((
+            (record, path, tail, record.blockers, record.goal_cut, False),
+        ), ))
+        if self.is_terminal:
+            record.path = new_path
+            return
+
+        record.goal_cut = self._moved_goal_cut(
+            record.goal_cut,
+            previous_state[1 + player],
+            position,
+            state[1 + FOLLOWING_PLAYER[player]],
         )
+        self._update_path(record, new_path, record.goal_cut)
+
+    def _moved_goal_cut(self, goal_cut, start, position, other_position):
+        """
+        Walls of ``goal_cut`` still cutting the goal off after the pawn
+        moved from ``start`` to ``position``. A wall which does not block
+        any square boundary the pawn crossed leaves both squares on the
+        same side, so only the walls blocking those boundaries are dropped.
+        """
+        if not goal_cut:
+            return set()
+        game = self.game
+        if game.delta_moves[position - start] in (UP, RIGHT, DOWN, LEFT):
+            steps = ((start, position), )
+        else:   # jump over the other pawn
+            steps = ((start, other_position), (other_position, position))
+        goal_cut = set(goal_cut)
+        for square, next_square in steps:
+            move = game.delta_moves[next_square - square]
+            goal_cut.difference_update(game.blocker_walls[4 * square + move])
+        return goal_cut
+
+    @property
+    def legal_actions(self):
+        """
+        Bitmask of the actions playable in the current state, computed on
+        the first use after a move and restored by ``undo``.
+
+        Only free walls on a player's shortest path and not yet in its
+        ``goal_cut`` need a reachability check, walls found to cut the
+        goal off are added to ``goal_cut``.
+        """
+        legal = self._legal
+        if legal is not None:
+            return legal
+        elif self.is_terminal:
+            self._legal = 0
+            return 0
+
+        game = self.game
+        state = self.state
+        player = state[0]
+        walls = game.walls_mask(state[5])
+        legal = game.pawn_moves_mask(
+            walls, state[1 + player], state[1 + FOLLOWING_PLAYER[player]]
+        ) << game.wall_moves
+        if state[3 + player]:
+            free = ((1 << game.wall_moves) - 1) & ~self.blocked
+            for record in self._players:
+                goal_cut = record.goal_cut
+                for wall in goal_cut:
+                    free &= ~(1 << wall)
+                position = state[1 + record.color]
+                for wall in record.blockers:
+                    if free >> wall & 1 and game.closes_wall_loop(
+                            walls, wall) and not game.can_reach_goal(
+                            walls | 1 << wall, record.color, position):
+                        free ^= 1 << wall
+                        goal_cut.add(wall)
+            legal |= free
+        self._legal = legal
+        return legal
 
     @property
     def invalid_actions(self):
-        invalid_pawn_moves = [
-            move + self.game.wall_moves
-            for move in range(12)
-            if not self.game.is_valid_pawn_move(self.state, move)
-        ]
-        return itertools.chain(
-            self._data['crossers'],
-            self.yellow['goal_cut'],
-            self.green['goal_cut'],
-            invalid_pawn_moves,
-        )
+        all_actions = (1 << self.game.all_moves) - 1
+        return mask_to_actions(all_actions & ~self.legal_actions)
 
     @property
-    def state(self):
-        return self._data['state']
+    def canonical(self):
+        return self.game.canonicalize(self.state)
 
     @property
     def players_dict(self):
         players = {}
-        for color in (YELLOW, GREEN):
-            players[color] = {
-                'name': self._data[color]['name'],
-                'player': self._data[color]['player'],
+        for record in self._players:
+            players[record.color] = {
+                'name': record.name,
+                'player': record.player,
             }
         return players
 
@@ -161,40 +370,49 @@ class QuoridorContext(object):
         return self.state[0]
 
     def __getitem__(self, key):
-        return self._data[key]
+        """
+        Player records for ``YELLOW`` and ``GREEN``, attributes such as
+        ``'blocked'`` or ``'start_state'`` for their names.
+        """
+        if key in (YELLOW, GREEN):
+            return self._players[key]
+        elif key in self.__slots__ and not key.startswith('_'):
+            return getattr(self, key)
+        raise KeyError(key)
 
     def __setitem__(self, key, value):
-        self._data[key] = value
+        if key in (YELLOW, GREEN):
+            self._players[key] = value
+        elif key in self.__slots__ and not key.startswith('_'):
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
 
     @property
     def winner(self):
         if self.is_terminal:
-            return self.following['color']
+            return self.following.color
 
     @property
     def following(self):
-        return self._data[FOLLOWING_PLAYER[self._data['state'][0]]]
+        return self._players[FOLLOWING_PLAYER[self.state[0]]]
 
     @property
     def current(self):
-        return self._data[self._data['state'][0]]
+        return self._players[self.state[0]]
 
     @property
     def yellow(self):
-        return self._data[YELLOW]
+        return self._players[YELLOW]
 
     @property
     def green(self):
-        return self._data[GREEN]
+        return self._players[GREEN]
 
     @property
     def is_terminal(self):
         return self.game.is_terminal(self.state)
 
-    @property
-    def history(self):
-        return self._data.get('history', [])
-
     @property
     def last_action(self):
         if self.history:
@@ -206,6 +424,6 @@ class QuoridorContext(object):
             history=self.history,
             yellow=self.yellow,
             green=self.green,
-            cross_num=len(self._data['crossers']),
-            crossers=self._data['crossers'],
+            blocked_num=len(mask_to_actions(self.blocked)),
+            blocked=mask_to_actions(self.blocked),
         )
@@ -0,0 +1,150 @@
+import collections
+
+
+class DistanceMap(object):
+    """
+    Distances from every square to the goal row of one player.
+
+    The map follows placed and removed walls incrementally: ``place_wall``
+    recomputes only the squares whose shortest routes all used one of the
+    cut edges and ``remove_wall`` only propagates the shortened distances
+    from the restored edges. ``None`` marks squares cut off from the goal.
+    ``place_wall`` returns the previous distances of the changed squares,
+    which ``restore`` puts back when the same wall is taken away again.
+    """
+
+    def __init__(self, game, walls, player):
+        self.game = game
+        self.player = player
+        self.walls = game.walls_mask(walls)
+        self.distances = game.distance_map(self.walls, player)
+
+    def copy(self):
+        distance_map = DistanceMap.__new__(DistanceMap)
+        distance_map.game = self.game
+        distance_map.player = self.player
+        distance_map.walls = self.walls
+        distance_map.distances = list(self.distances)
+        return distance_map
+
+    def __getitem__(self, position):
+        return self.distances[position]
+
+    def place_wall(self, wall):
+        old_walls = self.walls
+        self.walls = old_walls | 1 << wall
+        distances = self.distances
+        orphans = []
+        for position, new_position, blockers in self.game.wall_edges[wall]:
+            if blockers & old_walls:
+                continue    # edge was already closed by another wall
+            distance = distances[position]
+            new_distance = distances[new_position]
+            if distance is None:
+                continue
+            elif distance == new_distance + 1:
+                orphans.append(position)
+            elif new_distance == distance + 1:
+                orphans.append(new_position)
+
+        if orphans:
+            return self._increase(orphans)
+        return []
+
+    def restore(self, wall, changes):
+        """Undoes ``place_wall(wall)`` that returned ``changes``."""
+        self.walls &= ~(1 << wall)
+        distances = self.distances
+        for position, distance in changes:
+            distances[position] = distance
+
+    def remove_wall(self, wall):
+        self.walls = walls = self.walls & ~(1 << wall)
+        distances = self.distances
+        to_visit = collections.deque()
+        for position, new_position, blockers in self.game.wall_edges[wall]:
+            if blockers & walls:
+                continue    # edge is still closed by another wall
+            for first, second in ((position, new_position),
+                                  (new_position, position)):
+                if distances[second] is None:
+                    continue
+                distance = distances[second] + 1
+                if distances[first] is None or distances[first] > distance:
+                    distances[first] = distance
+                    to_visit.append(first)
+
+        neighbors = self.game.neighbors
+        while to_visit:
+            position = to_visit.popleft()
+            distance = distances[position] + 1
+            for new_position, blockers in neighbors[position]:
+                if blockers & walls:
+                    continue
+                if distances[new_position] is None or (
+                        distances[new_position] > distance):
+                    distances[new_position] = distance
+                    to_visit.append(new_position)
+
+    def _increase(self, orphans):
+        neighbors = self.game.neighbors
+        distances = self.distances
+        walls = self.walls
+
+        # find squares that lost every shortest route to the goal, level by
+        # level, so that all possible supporters are already decided
+        affected = set()
+        levels = collections.defaultdict(list)
+        for position in orphans:
+            levels[distances[position]].append(position)
+        distance = min(levels)
+        while levels:
+            for position in levels.pop(distance, ()):
+                if position in affected:
+                    continue
+                followers = []
+                for new_position, blockers in neighbors[position]:
+                    if blockers & walls:
+                        continue
+                    new_distance = distances[new_position]
+                    if new_distance == distance + 1:
+                        followers.append(new_position)
+                    elif new_distance == distance - 1 and (
+                            new_position not in affected):
+                        break   # still supported by an unaffected square
+                else:
+                    affected.add(position)
+                    if followers:
+                        levels[distance + 1].extend(followers)
+            distance += 1
+
+        # settle affected squares from their unaffected surroundings
+        changes = [(position, distances[position]) for position in affected]
+        for position in affected:
+            distances[position] = None
+        for position in affected:
+            best = None
+            for new_position, blockers in neighbors[position]:
+                distance = distances[new_position]
+                if distance is not None and not blockers & walls and (
+                        best is None or distance < best):
+                    best = distance
+            if best is not None:
+                levels[best + 1].append(position)
+
+        distance = min(levels) if levels else 0
+        while levels:
+            for position in levels.pop(distance, ()):
+                if distances[position] is not None:
+                    continue
+                distances[position] = distance
+                for new_position, blockers in neighbors[position]:
+                    if distances[new_position] is None and (
+                            new_position in affected) and (
+                            not blockers & walls):
+                        levels[distance + 1].append(new_position)
+            distance += 1
+        return changes
+
+    def path(self, position):
+        return self.game.distance_path(self.distances, self.walls, position)
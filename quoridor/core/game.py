@@ -1,3 +1,6 @@
+import heapq
+import random
+import numbers
 import collections
 
 # TODO: documentation
@@ -59,7 +62,27 @@ ANTI_MOVE = {
     DOWNRIGHT: UPLEFT,
 }
 
+# symmetries are combinations of these two flags, identity is 0
+SYMMETRY_MIRROR = 1     # left-right mirror
+SYMMETRY_FLIP = 2       # top-bottom flip with swapped colors
+SYMMETRY_MOVES = {
+    SYMMETRY_MIRROR: {
+        UP: UP, RIGHT: LEFT, DOWN: DOWN, LEFT: RIGHT,
+        UPUP: UPUP, RIGHTRIGHT: LEFTLEFT, DOWNDOWN: DOWNDOWN,
+        LEFTLEFT: RIGHTRIGHT, UPRIGHT: UPLEFT, UPLEFT: UPRIGHT,
+        DOWNRIGHT: DOWNLEFT, DOWNLEFT: DOWNRIGHT,
+    },
+    SYMMETRY_FLIP: {
+        UP: DOWN, RIGHT: RIGHT, DOWN: UP, LEFT: LEFT,
+        UPUP: DOWNDOWN, RIGHTRIGHT: RIGHTRIGHT, DOWNDOWN: UPUP,
+        LEFTLEFT: LEFTLEFT, UPRIGHT: DOWNRIGHT, UPLEFT: DOWNLEFT,
+        DOWNRIGHT: UPRIGHT, DOWNLEFT: UPLEFT,
+    },
+}
+
 BOARD_SIZE_DEFAULT = 9
+COMPONENTS_CACHE_SIZE = 256
+PATH_CACHE_SIZE_DEFAULT = 4096
 
 
 def _make_initial_state(board_size):
@@ -124,6 +147,131 @@ def _make_blocker_positions(board_size):
     return blocker_positions
 
 
+# byte -> byte with reversed bit order, packed walls use numpy.packbits order
+_REVERSED_BYTES = [int('{0:08b}'.format(byte)[::-1], 2) for byte in range(256)]
+
+
+def walls_to_mask(walls):
+    mask = 0
+    for wall in walls:
+        mask |= 1 << wall
+    return mask
+
+
+def mask_to_actions(mask):
+    actions = []
+    while mask:
+        lowest = mask & -mask
+        actions.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return actions
+
+
+def mask_to_walls(mask):
+    return frozenset(mask_to_actions(mask))
+
+
+def _make_blocker_masks(blocker_positions):
+    blocker_masks = [None] * (4 * len(blocker_positions))
+    for position, moves in blocker_positions.items():
+        for move, walls in moves.items():
+            blocker_masks[4 * position + move] = walls_to_mask(walls)
+    return blocker_masks
+
+
+def _make_blocker_walls(blocker_positions):
+    blocker_walls = [None] * (4 * len(blocker_positions))
+    for position, moves in blocker_positions.items():
+        for move, walls in moves.items():
+            blocker_walls[4 * position + move] = tuple(sorted(walls))
+    return blocker_walls
+
+
+def _make_neighbors(board_size, blocker_masks):
+    move_deltas = _make_move_deltas(board_size)
+    neighbors = []
+    for position in range(board_size ** 2):
+        neighbors.append(tuple(
+            (position + move_deltas[move], blocker_masks[4 * position + move])
+            for move in (UP, RIGHT, DOWN, LEFT)
+            if blocker_masks[4 * position + move] is not None
+        ))
+    return neighbors
+
+
+def _make_goal_neighbors(board_size, blocker_masks):
+    """
+    Neighbors as in ``_make_neighbors`` ordered for a depth first search
+    from a stack, so the step towards the goal row is tried first.
+    """
+    move_deltas = _make_move_deltas(board_size)
+    orders = {YELLOW: (UP, LEFT, RIGHT, DOWN), GREEN: (DOWN, LEFT, RIGHT, UP)}
+    return dict(
+        (player, [
+            tuple(
+                (position + move_deltas[move],
+                 blocker_masks[4 * position + move])
+                for move in orders[player]
+                if blocker_masks[4 * position + move] is not None
+            )
+            for position in range(board_size ** 2)
+        ])
+        for player in (YELLOW, GREEN)
+    )
+
+
+def _make_edge_masks(blocker_masks):
+    return [
+        tuple(
+            (1 << move, blocker_masks[4 * position + move])
+            for move in (UP, RIGHT, DOWN, LEFT)
+            if blocker_masks[4 * position + move] is not None
+        )
+        for position in range(len(blocker_masks) // 4)
+    ]
+
+
+def _make_neighbor_moves(board_size, blocker_masks):
+    move_deltas = _make_move_deltas(board_size)
+    return [
+        dict(
+            (position + move_deltas[move], move)
+            for move in (UP, RIGHT, DOWN, LEFT)
+            if blocker_masks[4 * position + move] is not None
+        )
+        for position in range(board_size ** 2)
+    ]
+
+
+def _make_pawn_moves_table():
+    """
+    Legal pawn moves mask indexed by ``[direction][edges][other_edges]``.
+    ``direction`` is the step to the adjacent opponent (4 when the opponent
+    is not adjacent), the edges are bits of the open steps (UP, RIGHT, DOWN,
+    LEFT) from the pawn and the opponent squares.
+    """
+    table = []
+    for direction in range(5):
+        table.append([])
+        for edges in range(16):
+            table[direction].append([])
+            for other_edges in range(16):
+                moves = 0
+                for move in (UP, RIGHT, DOWN, LEFT):
+                    if edges >> move & 1 and move != direction:
+                        moves |= 1 << move
+                for move in range(4, 12):
+                    for first, second in PAWN_MOVE_PATHS[move]:
+                        if first == direction and edges >> first & 1 and (
+                                other_edges >> second & 1):
+                            moves |= 1 << move
+                table[direction][edges].append(moves)
+    return table
+
+
+PAWN_MOVES_TABLE = _make_pawn_moves_table()
+
+
 def _make_goal_positions(board_size):
     return {
         YELLOW: frozenset(
@@ -142,6 +290,163 @@ def _make_move_deltas(board_size):
     }
 
 
+def _make_wall_edges(board_size, blocker_positions, blocker_masks):
+    move_deltas = _make_move_deltas(board_size)
+    wall_edges = [[] for _ in range(2 * (board_size - 1) ** 2)]
+    for position in range(board_size ** 2):
+        for move in (RIGHT, DOWN):
+            for wall in sorted(blocker_positions[position].get(move, ())):
+                wall_edges[wall].append((
+                    position,
+                    position + move_deltas[move],
+                    blocker_masks[4 * position + move],
+                ))
+    return [tuple(edges) for edges in wall_edges]
+
+
+def _make_wall_points(board_size):
+    """
+    Three lattice points (end, center, end) touched by each wall. Lattice
+    point (row, col) is row * (board_size + 1) + col, all points lying on
+    the board edge are merged into a single point (board_size + 1) ** 2.
+    """
+    border = (board_size + 1) ** 2
+    wall_board_size = board_size - 1
+
+    def point(row, col):
+        if row in (0, board_size) or col in (0, board_size):
+            return border
+        return row * (board_size + 1) + col
+
+    wall_points = []
+    for wall in range(2 * wall_board_size ** 2):
+        row, col = divmod(wall % wall_board_size ** 2, wall_board_size)
+        if wall < wall_board_size ** 2:     # horizontal
+            wall_points.append(tuple(
+                point(row + 1, col + i) for i in range(3)
+            ))
+        else:
+            wall_points.append(tuple(
+                point(row + i, col + 1) for i in range(3)
+            ))
+    return wall_points
+
+
+def _find_root(parents, point):
+    root = point
+    while parents[root] != root:
+        root = parents[root]
+    while parents[point] != root:
+        parents[point], point = root, parents[point]
+    return root
+
+
+def _join_wall(parents, wall_points):
+    roots = [_find_root(parents, point) for point in wall_points]
+    for root in roots[1:]:
+        parents[root] = roots[0]
+    return roots[0] in roots[1:] or roots[1] == roots[2]
+
+
+def _make_pawn_move_deltas(board_size):
+    move_deltas = _make_move_deltas(board_size)
+    return [
+        sum(move_deltas[pawn_move] for pawn_move in PAWN_MOVE_PATHS[move][0])
+        for move in range(12)
+    ]
+
+
+def _make_wall_crossers(board_size):
+    wall_board_size = board_size - 1
+    wall_board_positions = wall_board_size ** 2
+    crossers = []
+    for wall in range(2 * wall_board_positions):
+        actions = set((wall, ))
+        if wall < wall_board_positions:
+            actions.add(wall + wall_board_positions)
+            col = wall % wall_board_size
+            if col:
+                actions.add(wall - 1)
+            if col != wall_board_size - 1:
+                actions.add(wall + 1)
+        else:
+            position = wall - wall_board_positions
+            actions.add(position)
+            row = position // wall_board_size
+            if row:
+                actions.add(wall - wall_board_size)
+            if row != wall_board_size - 1:
+                actions.add(wall + wall_board_size)
+        crossers.append(frozenset(actions))
+    return crossers
+
+
+def _make_symmetries(board_size, blocker_positions):
+    """
+    For every symmetry returns ``(position_map, action_map)``. Wall images
+    are found by matching the pawn steps that each wall blocks.
+    """
+    wall_edges = collections.defaultdict(set)
+    for position, moves in blocker_positions.items():
+        for move, walls in moves.items():
+            for wall in walls:
+                wall_edges[wall].add((position, move))
+    edges_wall = dict(
+        (frozenset(edges), wall) for wall, edges in wall_edges.items()
+    )
+
+    symmetries = []
+    for symmetry in range(4):
+        moves = dict((move, move) for move in range(12))
+        position_map = []
+        for position in range(board_size ** 2):
+            row, col = divmod(position, board_size)
+            if symmetry & SYMMETRY_MIRROR:
+                col = board_size - 1 - col
+            if symmetry & SYMMETRY_FLIP:
+                row = board_size - 1 - row
+            position_map.append(board_size * row + col)
+        for flag in (SYMMETRY_MIRROR, SYMMETRY_FLIP):
+            if symmetry & flag:
+                moves = dict(
+                    (move, SYMMETRY_MOVES[flag][image])
+                    for move, image in moves.items()
+                )
+
+        action_map = [
+            edges_wall[frozenset(
+                (position_map[position], moves[move])
+                for position, move in wall_edges[wall]
+            )]
+            for wall in range(len(wall_edges))
+        ]
+        action_map.extend(len(wall_edges) + moves[move] for move in range(12))
+        symmetries.append((position_map, action_map))
+    return symmetries
+
+
+def _make_goal_rows(board_size):
+    """Rows between each position and the goal row of each player."""
+    return {
+        YELLOW: [
+            board_size - 1 - position // board_size
+            for position in range(board_size ** 2)
+        ],
+        GREEN: [position // board_size for position in range(board_size ** 2)],
+    }
+
+
+def _make_goal_flags(board_size):
+    goal_positions = _make_goal_positions(board_size)
+    return dict(
+        (player, [
+            position in goal_positions[player]
+            for position in range(board_size ** 2)
+        ])
+        for player in (YELLOW, GREEN)
+    )
+
+
 def _make_delta_moves(board_size):
     return {
         -board_size: UP,
@@ -161,6 +466,127 @@ def _make_delta_moves(board_size):
     }
 
 
+ZobristKeys = collections.namedtuple('ZobristKeys', (
+    'on_move',      # xored in when GREEN is on move
+    'positions',    # player -> position -> key
+    'walls_left',   # player -> remaining walls count -> key
+    'walls',        # wall -> key
+))
+
+
+def _make_zobrist_keys(board_size):
+    """
+    Random 64-bit keys for every state component. The generator is seeded
+    with the board size, so keys are stable between runs and processes.
+    """
+    generator = random.Random(board_size)
+
+    def keys(count):
+        return [generator.getrandbits(64) for i in range(count)]
+
+    wall_moves = 2 * (board_size - 1) ** 2
+    walls_left = max(STARTING_WALL_COUNT, wall_moves) + 1
+    return ZobristKeys(
+        on_move=generator.getrandbits(64),
+        positions=(keys(board_size ** 2), keys(board_size ** 2)),
+        walls_left=(keys(walls_left), keys(walls_left)),
+        walls=keys(wall_moves),
+    )
+
+
+Geometry = collections.namedtuple('Geometry', (
+    'blocker_positions',    # position -> move -> set of blocking walls
+    'blocker_masks',        # 4 * position + move -> walls mask or None
+    'blocker_walls',        # 4 * position + move -> walls tuple or None
+    'neighbors',            # position -> ((new_position, walls mask), ...)
+    'goal_neighbors',       # player -> position -> neighbors, goal last
+    'neighbor_moves',       # position -> {new_position: move}
+    'edge_masks',           # position -> ((1 << move, walls mask), ...)
+    'wall_edges',           # wall -> ((position, new_position, mask), ...)
+    'wall_points',          # wall -> (end, center, end) lattice points
+    'pawn_move_deltas',     # pawn move -> position delta
+    'goal_flags',           # player -> position -> is goal
+    'goal_rows',            # player -> position -> rows to goal
+    'crossers',             # wall -> frozenset of walls it cannot share
+    'crosser_masks',        # wall -> walls mask of crossers
+    'zobrist_keys',         # ZobristKeys of state components
+    'symmetries',           # symmetry -> (position map, action map)
+))
+
+_GEOMETRIES = {}
+
+
+def _make_geometry(board_size):
+    geometry = _GEOMETRIES.get(board_size)
+    if geometry is None:
+        blocker_positions = _make_blocker_positions(board_size)
+        blocker_masks = _make_blocker_masks(blocker_positions)
+        crossers = _make_wall_crossers(board_size)
+        geometry = _GEOMETRIES[board_size] = Geometry(
+            blocker_positions=blocker_positions,
+            blocker_masks=blocker_masks,
+            blocker_walls=_make_blocker_walls(blocker_positions),
+            neighbors=_make_neighbors(board_size, blocker_masks),
+            goal_neighbors=_make_goal_neighbors(board_size, blocker_masks),
+            neighbor_moves=_make_neighbor_moves(board_size, blocker_masks),
+            edge_masks=_make_edge_masks(blocker_masks),
+            wall_edges=_make_wall_edges(
+                board_size, blocker_positions, blocker_masks
+            ),
+            wall_points=_make_wall_points(board_size),
+            pawn_move_deltas=_make_pawn_move_deltas(board_size),
+            goal_flags=_make_goal_flags(board_size),
+            goal_rows=_make_goal_rows(board_size),
+            crossers=crossers,
+            crosser_masks=[walls_to_mask(walls) for walls in crossers],
+            zobrist_keys=_make_zobrist_keys(board_size),
+            symmetries=_make_symmetries(board_size, blocker_positions),
+        )
+    return geometry
+
+
+class PathCache(object):
+    """
+    Least recently used shortest paths, keyed by
+    ``(walls mask, player, position, avoid)``.
+    """
+
+    def __init__(self, limit=PATH_CACHE_SIZE_DEFAULT):
+        assert limit > 0
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self._paths = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._paths)
+
+    def get(self, key):
+        """Returns a copy of the cached path, or False when not cached."""
+        path = self._paths.pop(key, False)
+        if path is False:
+            self.misses += 1
+            return False
+        self.hits += 1
+        self._paths[key] = path     # most recently used goes last
+        return None if path is None else list(path)
+
+    def put(self, key, path):
+        if len(self._paths) >= self.limit:
+            self._paths.popitem(last=False)
+        self._paths[key] = None if path is None else tuple(path)
+
+    def clear(self):
+        self._paths.clear()
+
+
+WallImpact = collections.namedtuple('WallImpact', (
+    'yellow',           # YELLOW's distance to goal with the wall, or None
+    'green',            # GREEN's distance to goal with the wall, or None
+    'disconnected',     # the wall cuts a pawn off its goal
+))
+
+
 class GameException(Exception):
     pass
 
@@ -181,138 +607,648 @@ class Quoridor2(object):
         self.wall_moves = 2 * self.wall_board_positions
         self.all_moves = self.wall_moves + 12
 
-        self.blocker_positions = _make_blocker_positions(self.board_size)
+        geometry = _make_geometry(self.board_size)
+        self.blocker_positions = geometry.blocker_positions
+        self.blocker_masks = geometry.blocker_masks
+        self.blocker_walls = geometry.blocker_walls
+        self.neighbors = geometry.neighbors
+        self.goal_neighbors = geometry.goal_neighbors
+        self.neighbor_moves = geometry.neighbor_moves
+        self.edge_masks = geometry.edge_masks
+        self.wall_edges = geometry.wall_edges
+        self.wall_points = geometry.wall_points
+        self.pawn_move_deltas = geometry.pawn_move_deltas
+        self.goal_flags = geometry.goal_flags
+        self.goal_rows = geometry.goal_rows
+        # weights of the steps in ``astar_path`` tie-breaking order
+        self._step_weights = [
+            5 ** (self.board_positions - depth)
+            for depth in range(self.board_positions + 1)
+        ]
+        self.crossers = geometry.crossers
+        self.crosser_masks = geometry.crosser_masks
+        self.zobrist_keys = geometry.zobrist_keys
+        self.symmetries = geometry.symmetries
         self.goal_positions = _make_goal_positions(self.board_size)
         self.move_deltas = _make_move_deltas(self.board_size)
         self.delta_moves = _make_delta_moves(self.board_size)
         self.all_actions = frozenset(range(self.all_moves))
-
-    def is_wall_crossing(self, walls, wall):
-        if wall in walls:
-            return True
-
-        if wall < self.wall_board_positions:
+        self._cached_walls = None
+        self._cached_mask = 0
+        self._components = {}
+        self.path_cache = None
+        self.packed_walls_size = (self.wall_moves + 7) // 8
+        self.packed_size = 5 + self.packed_walls_size
+
+    def to_bitboard_state(self, state):
+        return state[:5] + (walls_to_mask(state[5]), )
+
+    def from_bitboard_state(self, state):
+        return state[:5] + (mask_to_walls(state[5]), )
+
+    def _walls_from_actions(self, actions):
+        return frozenset(actions)
+
+    def pack(self, state):
+        """
+        Fixed width bytes: on move, both positions and wall counts, one
+        byte each, followed by the walls with wall ``8 * i + j`` in bit
+        ``7 - j`` of byte ``i`` (21 bytes on 9x9 board).
+        """
+        mask = self.walls_mask(state[5])
+        data = bytearray(state[:5])
+        for i in range(self.packed_walls_size):
+            data.append(_REVERSED_BYTES[mask >> 8 * i & 255])
+        return bytes(data)
+
+    def unpack(self, packed):
+        data = bytearray(packed)
+        if len(data) != self.packed_size:
+            raise GameException('Packed state has invalid size!')
+        mask = 0
+        for i, byte in enumerate(data[5:]):
+            mask |= _REVERSED_BYTES[byte] << 8 * i
+        walls = self._walls_from_actions(mask_to_actions(mask))
+        return tuple(data[:5]) + (walls, )
+
+    def transform_state(self, state, symmetry):
+        position_map, action_map = self.symmetries[symmetry]
+        walls = self._walls_from_actions([
+            action_map[wall]
+            for wall in mask_to_actions(self.walls_mask(state[5]))
+        ])
+        if symmetry & SYMMETRY_FLIP:
             return (
-                wall + self.wall_board_positions in walls or \
-                (wall % self.wall_board_size != 0 and (wall - 1) in walls) or \
-                ((wall + 1) % self.wall_board_size != 0 and (wall + 1) in walls)
+                FOLLOWING_PLAYER[state[0]],
+                position_map[state[2]],
+                position_map[state[1]],
+                state[4],
+                state[3],
+                walls,
             )
-
-        position = wall - self.wall_board_positions
-        row = position // self.wall_board_size
         return (
-            position in walls or \
-            (row != 0 and (wall - self.wall_board_size) in walls) or \
-            (
-                row != (self.wall_board_size - 1) and \
-                (wall + self.wall_board_size) in walls
+            state[0],
+            position_map[state[1]],
+            position_map[state[2]],
+            state[3],
+            state[4],
+            walls,
+        )
+
+    def canonicalize(self, state):
+        """
+        Canonical form of the state, always with YELLOW on move, and the
+        list mapping actions of ``state`` to actions of the canonical form.
+        The colors are swapped when GREEN is on move, from the two mirror
+        images the one with smaller pawn positions and walls mask is taken.
+        """
+        symmetry = SYMMETRY_FLIP if state[0] == GREEN else 0
+        canonical = self.transform_state(state, symmetry)
+        mirrored = self.transform_state(state, symmetry | SYMMETRY_MIRROR)
+        if mirrored[1:3] + (self.walls_mask(mirrored[5]), ) < (
+                canonical[1:3] + (self.walls_mask(canonical[5]), )):
+            canonical = mirrored
+            symmetry |= SYMMETRY_MIRROR
+        return canonical, self.symmetries[symmetry][1]
+
+    def state_key(self, state):
+        keys = self.zobrist_keys
+        key = keys.on_move if state[0] == GREEN else 0
+        key ^= keys.positions[YELLOW][state[1]]
+        key ^= keys.positions[GREEN][state[2]]
+        key ^= keys.walls_left[YELLOW][state[3]]
+        key ^= keys.walls_left[GREEN][state[4]]
+        for wall in mask_to_actions(self.walls_mask(state[5])):
+            key ^= keys.walls[wall]
+        return key
+
+    def key_delta(self, state, action):
+        """
+        Value to xor with ``state_key(state)`` to get the key of the state
+        after ``action``. Xoring it again on the resulting key undoes it.
+        """
+        keys = self.zobrist_keys
+        player = state[0]
+        delta = keys.on_move
+        if 0 <= action < self.wall_moves:
+            walls_left = keys.walls_left[player]
+            return delta ^ keys.walls[action] ^ (
+                walls_left[state[3 + player]] ^
+                walls_left[state[3 + player] - 1]
             )
+
+        position = state[1 + player]
+        new_position = self.pawn_move_target(
+            self.walls_mask(state[5]),
+            position,
+            state[1 + FOLLOWING_PLAYER[player]],
+            action - self.wall_moves,
         )
+        if new_position is None:
+            raise InvalidMove('Invalid pawn move!')
+        positions = keys.positions[player]
+        return delta ^ positions[position] ^ positions[new_position]
+
+    def walls_mask(self, walls):
+        if walls is self._cached_walls:
+            return self._cached_mask
+        elif isinstance(walls, numbers.Integral):
+            return walls    # already a mask
+        mask = walls_to_mask(walls)
+        if type(walls) is frozenset:    # mutable sets may change in place
+            self._cached_walls = walls
+            self._cached_mask = mask
+        return mask
+
+    def _has_wall(self, walls, wall):
+        return wall in walls
+
+    def _add_wall(self, walls, wall):
+        return walls.union((wall, ))
+
+    def _remove_wall(self, walls, wall):
+        return walls.difference((wall, ))
+
+    def is_wall_crossing(self, walls, wall):
+        return bool(self.crosser_masks[wall] & self.walls_mask(walls))
 
     def wall_crossers(self, wall):
-        actions = set((wall, ))
-        if wall < self.wall_board_positions:
-            actions.add(wall + self.wall_board_positions)
-            col = wall % self.wall_board_size
-            if col:
-                actions.add(wall - 1)
-            if col != self.wall_board_size - 1:
-                actions.add(wall + 1)
-        else:
-            actions.add(wall - self.wall_board_positions)
-            position = wall - self.wall_board_positions
-            actions.add(position)
-            row = position // self.wall_board_size
-            if row:
-                actions.add(wall - self.wall_board_size)
-            if row != self.wall_board_size - 1:
-                actions.add(wall + self.wall_board_size)
-        return actions
+        return self.crossers[wall]
+
+    def crossing_mask(self, walls):
+        crossing = 0
+        for wall in mask_to_actions(self.walls_mask(walls)):
+            crossing |= self.crosser_masks[wall]
+        return crossing
 
     def crossing_actions(self, state):
-        actions = set(state[5])
-        for wall in state[5]:
-            if wall < self.wall_board_positions:
-                actions.add(wall + self.wall_board_positions)
-                col = wall % self.wall_board_size
-                if col:
-                    actions.add(wall - 1)
-                if col != self.wall_board_size - 1:
-                    actions.add(wall + 1)
-            else:
-                position = wall - self.wall_board_positions
-                actions.add(position)
-                row = position // self.wall_board_size
-                if row:
-                    actions.add(wall - self.wall_board_size)
-                if row != self.wall_board_size - 1:
-                    actions.add(wall + self.wall_board_size)
-        return actions
+        return set(mask_to_actions(self.crossing_mask(state[5])))
 
     def is_move_impossible(self, state, position, pawn_move):
-        intercepting_walls = self.blocker_positions[position].get(pawn_move)
-        return intercepting_walls is None or intercepting_walls & state[5]
+        blockers = self.blocker_masks[4 * position + pawn_move]
+        return blockers is None or bool(blockers & self.walls_mask(state[5]))
+
+    def pawn_move_target(self, walls, position, other_position, move):
+        blocker_masks = self.blocker_masks
+        if move < 4:
+            blockers = blocker_masks[4 * position + move]
+            if blockers is None or blockers & walls:
+                return None
+            new_position = position + self.pawn_move_deltas[move]
+            if new_position == other_position:
+                return None
+            return new_position
+
+        for first, second in PAWN_MOVE_PATHS.get(move, ()):
+            blockers = blocker_masks[4 * position + first]
+            if blockers is None or blockers & walls:
+                continue
+            middle = position + self.pawn_move_deltas[first]
+            if middle != other_position:
+                continue
+            blockers = blocker_masks[4 * middle + second]
+            if blockers is None or blockers & walls:
+                continue
+            return middle + self.pawn_move_deltas[second]
+        return None
+
+    def open_edges(self, walls, position):
+        edges = 0
+        for bit, blockers in self.edge_masks[position]:
+            if not blockers & walls:
+                edges |= bit
+        return edges
+
+    def pawn_moves_mask(self, walls, position, other_position):
+        """Mask of legal pawn moves, bit ``move`` set when it is legal."""
+        direction = self.neighbor_moves[position].get(other_position, 4)
+        if direction == 4:
+            return PAWN_MOVES_TABLE[4][self.open_edges(walls, position)][0]
+        return PAWN_MOVES_TABLE[direction][self.open_edges(walls, position)][
+            self.open_edges(walls, other_position)
+        ]
 
     def is_valid_pawn_move(self, state, move):
-        current_pawn = state[1 + state[0]]
-        other_pawn = state[1 + FOLLOWING_PLAYER[state[0]]]
-        pawn_move_paths = PAWN_MOVE_PATHS.get(move, [])
-
-        if 0 <= move <= 3:
-            next_position = current_pawn + self.move_deltas[move]
-            if next_position == other_pawn:
-                return False
-            return not self.is_move_impossible(state, current_pawn, move)
-
-        for pawn_moves in pawn_move_paths:
-            next_position = current_pawn + self.move_deltas[pawn_moves[0]]
-            if next_position != other_pawn:
-                continue
+        if not 0 <= move < 12:
+            return False
+        player = state[0]
+        return self.pawn_move_target(
+            self.walls_mask(state[5]),
+            state[1 + player],
+            state[1 + FOLLOWING_PLAYER[player]],
+            move,
+        ) is not None
 
-            position = current_pawn
-            for pawn_move in pawn_moves:
-                if self.is_move_impossible(state, position, pawn_move):
-                    break
-                position += self.move_deltas[pawn_move]
-            else:
-                return True
-        return False
+    def enable_path_cache(self, limit=PATH_CACHE_SIZE_DEFAULT):
+        self.path_cache = PathCache(limit)
+        return self.path_cache
+
+    def disable_path_cache(self):
+        self.path_cache = None
 
     def shortest_path(self, state, player, avoid=None):
-        avoid = avoid or set()
+        walls = self.walls_mask(state[5])
         player_position = state[1 + player]
+        if self.path_cache is None:
+            return self._shortest_path(walls, player, player_position, avoid)
+
+        key = (walls, player, player_position,
+               frozenset(avoid) if avoid else None)
+        path = self.path_cache.get(key)
+        if path is False:
+            path = self._shortest_path(walls, player, player_position, avoid)
+            self.path_cache.put(key, path)
+        return path
+
+    def _shortest_path(self, walls, player, player_position, avoid):
+        avoid = avoid or ()
+        goal_flags = self.goal_flags[player]
+        neighbors = self.neighbors
+        previous_positions = [None] * self.board_positions
+        previous_positions[player_position] = player_position
         to_visit = collections.deque((player_position, ))
-        visited = set()
-        previous_positions = {}
 
         while to_visit:
             position = to_visit.popleft()
-            if position in visited:
-                continue
+            if goal_flags[position] and position not in avoid:
+                path = [position]
+                while position != player_position:
+                    position = previous_positions[position]
+                    path.append(position)
+                return path
+
+            for new_position, blockers in neighbors[position]:
+                if previous_positions[new_position] is None and (
+                        not blockers & walls):
+                    previous_positions[new_position] = position
+                    to_visit.append(new_position)
+
+    def pawn_path(self, state, player):
+        """
+        Shortest path of real pawn moves to the goal with the other pawn
+        standing still: its square cannot be entered, but it can be jumped
+        over or sidestepped as ``PAWN_MOVE_PATHS`` allow. Consecutive
+        squares of a jump path are two steps apart.
+        """
+        walls = self.walls_mask(state[5])
+        player_position = state[1 + player]
+        other_position = state[1 + FOLLOWING_PLAYER[player]]
+        goal_flags = self.goal_flags[player]
+        neighbors = self.neighbors
+        other_neighbors = self.neighbor_moves[other_position]
+        pawn_move_deltas = self.pawn_move_deltas
+        previous_positions = [None] * self.board_positions
+        previous_positions[player_position] = player_position
+        previous_positions[other_position] = other_position
+        to_visit = collections.deque((player_position, ))
 
-            if position in self.goal_positions[player] and (
-                    position not in avoid):
-                # TODO: consider using ordered set:
+        while to_visit:
+            position = to_visit.popleft()
+            if goal_flags[position]:
                 path = [position]
-                while True:
-                    previous_position = previous_positions.get(path[-1])
-                    path.append(previous_position)
-                    if previous_position == player_position:
-                        return path
-
-            visited.add(position)
-            for move, blockers in self.blocker_positions[position].items():
-                if not blockers & state[5]:
-                    new_position = position + self.move_deltas[move]
-                    if new_position not in visited:
-                        to_visit.append(new_position)
-                    if new_position not in previous_positions:
+                while position != player_position:
+                    position = previous_positions[position]
+                    path.append(position)
+                return path
+
+            if position in other_neighbors:
+                moves = self.pawn_moves_mask(walls, position, other_position)
+                for move in mask_to_actions(moves):
+                    new_position = position + pawn_move_deltas[move]
+                    if previous_positions[new_position] is None:
                         previous_positions[new_position] = position
+                        to_visit.append(new_position)
+                continue
+
+            for new_position, blockers in neighbors[position]:
+                if previous_positions[new_position] is None and (
+                        not blockers & walls):
+                    previous_positions[new_position] = position
+                    to_visit.append(new_position)
+
+    def pawn_distance(self, state, player):
+        """Number of pawn moves to the goal, see ``pawn_path``."""
+        path = self.pawn_path(state, player)
+        if path is not None:
+            return len(path) - 1
+
+    def astar_path(self, state, player, avoid=None, exact=True):
+        """
+        A* search with the rows to goal as the heuristic.
+
+        With ``exact`` the result is the same path as ``shortest_path``:
+        breadth first search finds the path with the lexicographically
+        smallest sequence of neighbor indices among the shortest ones, so
+        every sequence is kept as a number with one base 5 digit per step
+        and ties of the estimate are broken by it. Otherwise ties prefer
+        squares nearer to the goal row, which expands fewer squares but may
+        return a different path of the same length.
+        """
+        avoid = avoid or ()
+        walls = self.walls_mask(state[5])
+        player_position = state[1 + player]
+        goal_flags = self.goal_flags[player]
+        goal_rows = self.goal_rows[player]
+        neighbors = self.neighbors
+        step_weights = self._step_weights
+        costs = [None] * self.board_positions
+        orders = [None] * self.board_positions
+        previous_positions = [None] * self.board_positions
+        closed = [False] * self.board_positions
+        costs[player_position] = orders[player_position] = 0
+        to_visit = [(goal_rows[player_position], 0, player_position)]
+
+        while to_visit:
+            estimate, order, position = heapq.heappop(to_visit)
+            if closed[position]:
+                continue
+            closed[position] = True
+            if goal_flags[position] and position not in avoid:
+                path = [position]
+                while position != player_position:
+                    position = previous_positions[position]
+                    path.append(position)
+                return path
+
+            cost = costs[position] + 1
+            step_weight = step_weights[cost]
+            for index, (new_position, blockers) in enumerate(
+                    neighbors[position], 1):
+                if closed[new_position] or blockers & walls:
+                    continue
+                new_cost = costs[new_position]
+                if exact:
+                    new_order = order + index * step_weight
+                    if new_cost is not None and (cost > new_cost or (
+                            cost == new_cost and
+                            new_order >= orders[new_position])):
+                        continue
+                    orders[new_position] = new_order
+                elif new_cost is not None and cost >= new_cost:
+                    continue
+                else:
+                    new_order = goal_rows[new_position]
+                costs[new_position] = cost
+                previous_positions[new_position] = position
+                heapq.heappush(to_visit, (
+                    cost + goal_rows[new_position], new_order, new_position
+                ))
+
+    def distance_map(self, walls, player):
+        walls = self.walls_mask(walls)
+        neighbors = self.neighbors
+        distances = [None] * self.board_positions
+        to_visit = collections.deque()
+        for position, is_goal in enumerate(self.goal_flags[player]):
+            if is_goal:
+                distances[position] = 0
+                to_visit.append(position)
+
+        while to_visit:
+            position = to_visit.popleft()
+            distance = distances[position] + 1
+            for new_position, blockers in neighbors[position]:
+                if distances[new_position] is None and not blockers & walls:
+                    distances[new_position] = distance
+                    to_visit.append(new_position)
+        return distances
+
+    def _source_distances(self, walls, position):
+        neighbors = self.neighbors
+        distances = [None] * self.board_positions
+        distances[position] = 0
+        to_visit = collections.deque((position, ))
+        while to_visit:
+            position = to_visit.popleft()
+            distance = distances[position] + 1
+            for new_position, blockers in neighbors[position]:
+                if distances[new_position] is None and not blockers & walls:
+                    distances[new_position] = distance
+                    to_visit.append(new_position)
+        return distances
+
+    def shortest_paths_mask(self, walls, player, position, goal_distances):
+        """
+        Mask of walls cutting any edge used by some shortest path from the
+        position to the goal, all other walls keep the distance unchanged.
+        """
+        walls = self.walls_mask(walls)
+        distance = goal_distances[position]
+        if distance is None:
+            return 0
+        source_distances = self._source_distances(walls, position)
+        mask = 0
+        for square, blocker_masks in enumerate(self.neighbors):
+            from_source = source_distances[square]
+            if from_source is None or (
+                    from_source + goal_distances[square] != distance):
+                continue
+            to_goal = goal_distances[square] - 1
+            for new_position, blockers in blocker_masks:
+                if goal_distances[new_position] == to_goal and (
+                        source_distances[new_position] == from_source + 1
+                        ) and not blockers & walls:
+                    mask |= blockers
+        return mask
+
+    def wall_impacts(self, state):
+        """
+        ``WallImpact`` for every wall the player on move could place
+        without crossing others, keyed by the wall. Walls with
+        ``disconnected`` set are illegal.
+
+        Only walls cutting a shortest path of a player need a new search
+        for that player, others keep its current distance.
+        """
+        if not state[3 + state[0]]:
+            return {}
+        walls = self.walls_mask(state[5])
+        free = ((1 << self.wall_moves) - 1) & ~self.crossing_mask(walls)
+        distances = []
+        path_walls = []
+        for player in (YELLOW, GREEN):
+            goal_distances = self.distance_map(walls, player)
+            distances.append(goal_distances[state[1 + player]])
+            path_walls.append(self.shortest_paths_mask(
+                walls, player, state[1 + player], goal_distances
+            ))
+
+        impacts = {}
+        for wall in mask_to_actions(free):
+            new_distances = list(distances)
+            for player in (YELLOW, GREEN):
+                if path_walls[player] >> wall & 1:
+                    path = self._shortest_path(
+                        walls | 1 << wall, player, state[1 + player], None
+                    )
+                    new_distances[player] = (
+                        None if path is None else len(path) - 1
+                    )
+            impacts[wall] = WallImpact(
+                new_distances[YELLOW],
+                new_distances[GREEN],
+                None in new_distances,
+            )
+        return impacts
+
+    def distance_path(self, distances, walls, position):
+        distance = distances[position]
+        if distance is None:
+            return None
+
+        walls = self.walls_mask(walls)
+        neighbors = self.neighbors
+        path = [position]
+        while distance:
+            distance -= 1
+            for new_position, blockers in neighbors[position]:
+                if distances[new_position] == distance and (
+                        not blockers & walls):
+                    position = new_position
+                    break
+            path.append(position)
+        path.reverse()
+        return path
+
+    def wall_components(self, walls):
+        """
+        Union-find parents over wall lattice points for placed walls, where
+        the whole board edge is one point.
+        """
+        walls = self.walls_mask(walls)
+        parents = self._components.get(walls)
+        if parents is None:
+            parents = list(range((self.board_size + 1) ** 2 + 1))
+            for wall in mask_to_walls(walls):
+                _join_wall(parents, self.wall_points[wall])
+            self._store_components(walls, parents)
+        return parents
+
+    def _store_components(self, walls, parents):
+        if len(self._components) >= COMPONENTS_CACHE_SIZE:
+            self._components.clear()
+        self._components[walls] = parents
+
+    def check_wall_paths(self, state, wall):
+        """
+        Raises ``InvalidMove`` when ``wall`` placed in ``state`` cuts a pawn
+        off its goal. Only walls closing a wall loop need the search, the
+        wall components with ``wall`` placed are kept for later calls.
+        """
+        walls = self.walls_mask(state[5]) | 1 << wall
+        parents = list(self.wall_components(state[5]))
+        if _join_wall(parents, self.wall_points[wall]) and (
+                not self.players_can_reach_goal(
+                    tuple(state[:5]) + (walls, ))):
+            raise InvalidMove('Pawn can not reach the goal!')
+        self._store_components(walls, parents)
+
+    def closes_wall_loop(self, walls, wall):
+        """
+        Only a wall touching one wall component (or the board edge) twice
+        can split the board, all other walls keep every square reachable.
+        """
+        parents = self.wall_components(walls)
+        a, b, c = [
+            _find_root(parents, point) for point in self.wall_points[wall]
+        ]
+        return a == b or b == c or a == c
+
+    def path_mask(self, path):
+        mask = 0
+        for i in range(len(path) - 1):
+            move = self.delta_moves[path[i + 1] - path[i]]
+            mask |= self.blocker_masks[4 * path[i] + move]
+        return mask
+
+    def legal_actions(self, state):
+        """
+        Bitmask over all actions, bit ``action`` set when it can be played.
+
+        Reachability is checked only for free walls that both close a wall
+        loop and lie on a current shortest path of one of the players.
+        """
+        if self.is_terminal(state):
+            return 0
+
+        player = state[0]
+        walls = self.walls_mask(state[5])
+        position = state[1 + player]
+        other_position = state[1 + FOLLOWING_PLAYER[player]]
+        legal = self.pawn_moves_mask(
+            walls, position, other_position
+        ) << self.wall_moves
+
+        if not state[3 + player]:
+            return legal
+
+        free = ((1 << self.wall_moves) - 1) & ~self.crossing_mask(walls)
+        path_walls = 0
+        for color in (YELLOW, GREEN):
+            path_walls |= self.path_mask(self.shortest_path(state, color))
+
+        parents = self.wall_components(walls)
+        for wall in mask_to_actions(free & path_walls):
+            a, b, c = [
+                _find_root(parents, point) for point in self.wall_points[wall]
+            ]
+            if (a == b or b == c or a == c) and not (
+                    self.players_can_reach_goal(
+                        state[:5] + (walls | 1 << wall, )
+                    )):
+                free ^= 1 << wall
+        return legal | free
+
+    def can_reach_goal(self, walls, player, position):
+        walls = self.walls_mask(walls)
+        goal_flags = self.goal_flags[player]
+        neighbors = self.goal_neighbors[player]
+        seen = [False] * self.board_positions
+        seen[position] = True
+        to_visit = [position]
+        while to_visit:
+            position = to_visit.pop()
+            if goal_flags[position]:
+                return True
+            for new_position, blockers in neighbors[position]:
+                if not seen[new_position] and not blockers & walls:
+                    seen[new_position] = True
+                    to_visit.append(new_position)
+        return False
 
     def players_can_reach_goal(self, state):
-        return bool(self.shortest_path(state, YELLOW)) and bool(
-            self.shortest_path(state, GREEN)
-        )
+        """
+        Searches from the YELLOW pawn until it reaches its goal. When the
+        GREEN pawn and its goal are met on the way, both are answered by
+        this single pass, otherwise GREEN gets its own search.
+        """
+        walls = self.walls_mask(state[5])
+        green_position = state[2]
+        yellow_goal_flags = self.goal_flags[YELLOW]
+        green_goal_flags = self.goal_flags[GREEN]
+        neighbors = self.goal_neighbors[YELLOW]
+        seen = [False] * self.board_positions
+        seen[state[1]] = True
+        to_visit = [state[1]]
+        yellow_goal = green_goal = False
+        while to_visit:
+            position = to_visit.pop()
+            if yellow_goal_flags[position]:
+                yellow_goal = True
+            elif green_goal_flags[position]:
+                green_goal = True
+            if yellow_goal and (green_goal or not seen[green_position]):
+                break
+            for new_position, blockers in neighbors[position]:
+                if not seen[new_position] and not blockers & walls:
+                    seen[new_position] = True
+                    to_visit.append(new_position)
+        else:
+            return False    # component of YELLOW has no YELLOW goal
+
+        if seen[green_position] and green_goal:
+            return True
+        return self.can_reach_goal(walls, GREEN, green_position)
 
     def initial_state(self):
         return _make_initial_state(self.board_size)
@@ -342,23 +1278,23 @@ class Quoridor2(object):
             if check_crossing:
                 if self.is_wall_crossing(state[5], action):
                     raise InvalidMove('Wall crosses already placed walls!')
-            new_state[5] = state[5].union((action, ))
+            new_state[5] = self._add_wall(state[5], action)
 
             if check_paths_to_goal:
-                if not self.players_can_reach_goal(new_state):
-                    raise InvalidMove('Pawn can not reach the goal!')
+                self.check_wall_paths(state, action)
 
             new_state[3 + player] -= 1
 
         elif self.wall_moves <= action <= self.all_moves:   # pawn move
-            move = action - self.wall_moves
-            if not self.is_valid_pawn_move(state, move):
+            new_position = self.pawn_move_target(
+                self.walls_mask(state[5]),
+                state[1 + player],
+                state[1 + FOLLOWING_PLAYER[player]],
+                action - self.wall_moves,
+            )
+            if new_position is None:
                 raise InvalidMove('Pawn cannot move there!')
-
-            new_state[1 + player] += sum([
-                self.move_deltas[pawn_move]
-                for pawn_move in PAWN_MOVE_PATHS[move][0]
-            ])
+            new_state[1 + player] = new_position
 
         else:
             raise InvalidMove('Unknown action {action}!'.format(action=action))
@@ -371,29 +1307,33 @@ class Quoridor2(object):
         new_state = list(state)
         new_state[0] = player
         if 0 <= action < self.wall_moves:
-            if state[5] and action in state[5]:
+            if self._has_wall(state[5], action):
                 new_state[3 + player] += 1
-                new_state[5] = new_state[5].difference((action, ))
+                new_state[5] = self._remove_wall(new_state[5], action)
                 return tuple(new_state)
             raise InvalidMove('Cannot undo!')
         move = action - self.wall_moves
         if move < 12:
-            anti_move = ANTI_MOVE[move]
-            if self.is_valid_pawn_move(new_state, anti_move):
-                new_state[1 + player] += sum([
-                    self.move_deltas[pawn_move]
-                    for pawn_move in PAWN_MOVE_PATHS[anti_move][0]
-                ])
+            new_position = self.pawn_move_target(
+                self.walls_mask(state[5]),
+                state[1 + player],
+                state[1 + state[0]],
+                ANTI_MOVE[move],
+            )
+            if new_position is not None:
+                new_state[1 + player] = new_position
                 return tuple(new_state)
         raise InvalidMove('Cannot undo!')
 
-    def path_blockers(self, path, crossers, avoid=None):
+    def path_blockers(self, path, blocked, avoid=None):
+        """Free walls cutting the path, ``blocked`` is a walls mask."""
         avoid = set() if avoid is None else avoid
         blockers = set()
+        blocker_walls = self.blocker_walls
         for i in range(len(path) - 1):
             move = self.delta_moves[path[i + 1] - path[i]]
-            for wall in self.blocker_positions[path[i]][move]:
-                if wall not in crossers and wall not in avoid:
+            for wall in blocker_walls[4 * path[i] + move]:
+                if not blocked >> wall & 1 and wall not in avoid:
                     blockers.add(wall)
         return blockers
 
@@ -403,3 +1343,33 @@ class Quoridor2(object):
 
     #     for action in wall_legal_moves(state):
     #         yield action
+
+
+class BitboardQuoridor2(Quoridor2):
+    """
+    Engine mode with placed walls stored as a single integer in state[5].
+
+    Bit ``i`` of the mask is set when wall action ``i`` is on the board, so
+    blocker and crossing checks become ``&`` tests against the precomputed
+    ``blocker_masks`` and ``crosser_masks``. Use ``to_bitboard_state`` and
+    ``from_bitboard_state`` to convert from and to the frozenset states
+    expected by QuoridorContext, the players and the db layer.
+    """
+
+    def initial_state(self):
+        return self.to_bitboard_state(_make_initial_state(self.board_size))
+
+    def walls_mask(self, walls):
+        return walls
+
+    def _walls_from_actions(self, actions):
+        return walls_to_mask(actions)
+
+    def _has_wall(self, walls, wall):
+        return bool(walls >> wall & 1)
+
+    def _add_wall(self, walls, wall):
+        return walls | 1 << wall
+
+    def _remove_wall(self, walls, wall):
+        return walls & ~(1 << wall)
@@ -0,0 +1,36 @@
+import numpy
+
+from quoridor.core.game import mask_to_actions
+
+
+def pack_states(game, states):
+    """
+    Packs a sequence of states into a uint8 array of shape
+    ``(len(states), game.packed_size)``, each row equal to ``game.pack``.
+    """
+    header = numpy.array([state[:5] for state in states], dtype=numpy.uint8)
+    header = header.reshape((len(states), 5))
+    rows, walls = [], []
+    for row, state in enumerate(states):
+        actions = mask_to_actions(game.walls_mask(state[5]))
+        rows.extend([row] * len(actions))
+        walls.extend(actions)
+
+    bits = numpy.zeros((len(states), game.wall_moves), dtype=numpy.uint8)
+    bits[rows, walls] = 1
+    packed_walls = numpy.packbits(bits, axis=1)
+    return numpy.concatenate((header, packed_walls), axis=1)
+
+
+def unpack_states(game, packed):
+    """Unpacks rows made by ``pack_states`` or ``game.pack`` into states."""
+    packed = numpy.asarray(packed, dtype=numpy.uint8)
+    assert packed.ndim == 2 and packed.shape[1] == game.packed_size
+    bits = numpy.unpackbits(packed[:, 5:], axis=1)[:, :game.wall_moves]
+    rows, walls = numpy.nonzero(bits)
+    splits = numpy.cumsum(bits.sum(axis=1, dtype=numpy.intp))[:-1]
+    header = packed[:, :5].tolist()
+    return [
+        tuple(values) + (game._walls_from_actions(actions.tolist()), )
+        for values, actions in zip(header, numpy.split(walls, splits))
+    ]
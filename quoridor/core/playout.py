@@ -0,0 +1,129 @@
+import random
+
+from quoridor.core.game import (
+    YELLOW,
+    GREEN,
+    FOLLOWING_PLAYER,
+    mask_to_actions,
+)
+from quoridor.core.distances import DistanceMap
+
+
+PATH_POLICY = 'path'
+RANDOM_POLICY = 'random'
+HEURISTIC_POLICY = 'heuristic'
+POLICIES = (PATH_POLICY, RANDOM_POLICY, HEURISTIC_POLICY)
+PLAYOUT_LENGTH_MAX = 500
+
+
+def _pawn_move(game, values, distances):
+    """Legal pawn move landing nearest to the goal, jumps included."""
+    player = values[0]
+    position = values[1 + player]
+    moves = game.pawn_moves_mask(
+        values[5], position, values[1 + FOLLOWING_PLAYER[player]]
+    )
+    best_move = best_distance = None
+    for move in mask_to_actions(moves):
+        distance = distances[position + game.pawn_move_deltas[move]]
+        if best_move is None or (distance is not None and (
+                best_distance is None or distance < best_distance)):
+            best_move, best_distance = move, distance
+    if best_move is not None:
+        return game.wall_moves + best_move
+
+
+def _blocking_wall(game, values, blocked, maps):
+    """
+    First wall cutting the opponent's path nearest to its pawn, which is
+    not on the player's own path and keeps both goals reachable. The wall
+    is already placed into ``maps`` when found.
+    """
+    player = values[0]
+    opponent = FOLLOWING_PLAYER[player]
+    walls = values[5]
+    own_walls = game.path_mask(maps[player].path(values[1 + player]))
+    path = maps[opponent].path(values[1 + opponent])
+    for i in range(len(path) - 1, 0, -1):
+        move = game.delta_moves[path[i - 1] - path[i]]
+        for wall in game.blocker_walls[4 * path[i] + move]:
+            if (blocked | own_walls) >> wall & 1:
+                continue
+            closes_loop = game.closes_wall_loop(walls, wall)
+            for distances in maps:
+                distances.place_wall(wall)
+            if closes_loop and (
+                    maps[YELLOW][values[1]] is None or
+                    maps[GREEN][values[2]] is None):
+                for distances in maps:
+                    distances.remove_wall(wall)
+                continue
+            return wall
+
+
+def playout(game, state, policy=PATH_POLICY, max_moves=PLAYOUT_LENGTH_MAX,
+            wall_probability=0.4, rng=random, actions=None):
+    """
+    Plays the game from ``state`` to the end with both players following
+    the built-in ``policy``, returns ``(winner, moves)``. The winner is
+    ``None`` when the game did not end in ``max_moves`` moves.
+
+    ``PATH_POLICY`` only moves the pawn towards the goal,
+    ``RANDOM_POLICY`` plays uniformly random legal actions and
+    ``HEURISTIC_POLICY`` moves like the path policy, but when the opponent
+    is not farther from its goal it places, with ``wall_probability``, a
+    wall on the opponent's path. The winner is also ``None`` when the
+    pawn on move has no legal move.
+
+    When ``actions`` is a list, the played actions are appended to it.
+    """
+    assert policy in POLICIES
+    values = list(state[:5]) + [game.walls_mask(state[5])]
+    maps = [
+        DistanceMap(game, values[5], YELLOW),
+        DistanceMap(game, values[5], GREEN),
+    ]
+    blocked = game.crossing_mask(values[5])
+    yellow_goal_flags = game.goal_flags[YELLOW]
+    green_goal_flags = game.goal_flags[GREEN]
+
+    for moves in range(max_moves + 1):
+        if yellow_goal_flags[values[1]]:
+            return YELLOW, moves
+        elif green_goal_flags[values[2]]:
+            return GREEN, moves
+        elif moves == max_moves:
+            break
+
+        player = values[0]
+        opponent = FOLLOWING_PLAYER[player]
+        action = None
+        if policy == RANDOM_POLICY:
+            action = rng.choice(mask_to_actions(
+                game.legal_actions(tuple(values))
+            ))
+            if action < game.wall_moves:
+                for distances in maps:
+                    distances.place_wall(action)
+        elif policy == HEURISTIC_POLICY and values[3 + player] and (
+                maps[opponent][values[1 + opponent]] <=
+                maps[player][values[1 + player]]) and (
+                rng.random() < wall_probability):
+            action = _blocking_wall(game, values, blocked, maps)
+        if action is None:
+            action = _pawn_move(game, values, maps[player])
+            if action is None:
+                break   # pawn is boxed in by walls and the other pawn
+
+        if actions is not None:
+            actions.append(action)
+        if action < game.wall_moves:
+            values[5] |= 1 << action
+            values[3 + player] -= 1
+            blocked |= game.crosser_masks[action]
+        else:
+            values[1 + player] += game.pawn_move_deltas[
+                action - game.wall_moves
+            ]
+        values[0] = opponent
+    return None, moves
@@ -0,0 +1,116 @@
+from quoridor.core.game import (
+    FOLLOWING_PLAYER,
+    InvalidMove,
+)
+
+
+class MutableState(object):
+    """
+    Game state changed in place by ``make`` and restored by ``unmake``.
+
+    ``values`` has the layout of the state tuple with walls kept as a mask,
+    so it can be passed directly to the read-only ``Quoridor2`` methods.
+    Each made action pushes a small delta on the undo stack.
+    """
+
+    __slots__ = ('game', 'values', 'key', '_stack')
+
+    def __init__(self, game, state=None):
+        state = game.initial_state() if state is None else state
+        self.game = game
+        self.values = list(state[:5]) + [game.walls_mask(state[5])]
+        self.key = game.state_key(state)
+        self._stack = []
+
+    @property
+    def state(self):
+        """Immutable bitboard state tuple."""
+        return tuple(self.values)
+
+    def to_state(self):
+        return self.game.from_bitboard_state(self.state)
+
+    @property
+    def player(self):
+        return self.values[0]
+
+    @property
+    def history(self):
+        return [delta[0] for delta in self._stack]
+
+    def is_terminal(self):
+        return self.game.is_terminal(self.values)
+
+    def legal_actions(self):
+        return self.game.legal_actions(self.state)
+
+    def make(self, action, check_crossing=True, check_paths_to_goal=True):
+        game = self.game
+        values = self.values
+        player = values[0]
+        keys = game.zobrist_keys
+
+        if 0 <= action < game.wall_moves:                   # wall
+            walls = values[5]
+            walls_left = values[3 + player]
+            if not walls_left:
+                raise InvalidMove('Not enough walls!')
+            if check_crossing and walls & game.crosser_masks[action]:
+                raise InvalidMove('Wall crosses already placed walls!')
+            if check_paths_to_goal:
+                game.check_wall_paths(values, action)
+            values[5] = walls | 1 << action
+            values[3 + player] = walls_left - 1
+            self.key ^= keys.walls[action] ^ (
+                keys.walls_left[player][walls_left] ^
+                keys.walls_left[player][walls_left - 1]
+            )
+            self._stack.append((action, None))
+
+        elif game.wall_moves <= action < game.all_moves:    # pawn move
+            position = values[1 + player]
+            new_position = game.pawn_move_target(
+                values[5],
+                position,
+                values[1 + FOLLOWING_PLAYER[player]],
+                action - game.wall_moves,
+            )
+            if new_position is None:
+                raise InvalidMove('Pawn cannot move there!')
+            values[1 + player] = new_position
+            self.key ^= (
+                keys.positions[player][position] ^
+                keys.positions[player][new_position]
+            )
+            self._stack.append((action, position))
+
+        else:
+            raise InvalidMove('Unknown action {action}!'.format(action=action))
+
+        values[0] = FOLLOWING_PLAYER[player]
+        self.key ^= keys.on_move
+
+    def unmake(self):
+        if not self._stack:
+            raise InvalidMove('Cannot undo!')
+        action, position = self._stack.pop()
+        keys = self.game.zobrist_keys
+        values = self.values
+        player = values[0] = FOLLOWING_PLAYER[values[0]]
+        self.key ^= keys.on_move
+
+        if position is None:                                # wall
+            walls_left = values[3 + player]
+            values[3 + player] = walls_left + 1
+            values[5] &= ~(1 << action)
+            self.key ^= keys.walls[action] ^ (
+                keys.walls_left[player][walls_left] ^
+                keys.walls_left[player][walls_left + 1]
+            )
+        else:                                               # pawn move
+            self.key ^= (
+                keys.positions[player][values[1 + player]] ^
+                keys.positions[player][position]
+            )
+            values[1 + player] = position
+        return action
@@ -8,7 +8,7 @@ import tensorflow as tf
 
 from optparse import OptionParser
 
-from core.game import YELLOW, GREEN, Quoridor2, InvalidMove
+from core.game import YELLOW, GREEN, Quoridor2
 from core.context import QuoridorContext
 from ai.players import (
     Player,
@@ -180,12 +180,11 @@ class TFPlayer(Player):
             self.output_layer, feed_dict={self.input_layer: state}
         )
 
+        legal = context.legal_actions
         for action in self._generate_action(qlnn_actions, context.state[0]):
-            try:
+            if legal >> action & 1:
                 context.update(action)
                 return
-            except InvalidMove:
-                pass
 
         # this will not get here, but in case...
         raise Exception('Could not play any action.')
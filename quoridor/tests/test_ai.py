@@ -1,12 +1,20 @@
 import random
 import numpy
 
-from nose.tools import assert_equal, assert_true, assert_false, nottest
+from nose.tools import (
+    assert_equal,
+    assert_true,
+    assert_false,
+    assert_raises,
+    nottest,
+)
 from nose.plugins.attrib import attr
 
 from quoridor.ai.perceptron import (
     MLMCPerceptron
 )
+from quoridor.ai.environment import VectorEnvironment
+from quoridor.core.game import YELLOW, GREEN, UP, DOWN, InvalidMove, Quoridor2
 
 
 @attr('perceptron', 'weight_sizes')
@@ -165,3 +173,49 @@ def test_MLMCP_comptuting_1():
     # TODO: test propagate_backwards
     # p.propagate_backward(activations, desired_output_vector)
     # print 'deltas:', p.delta_weights
+
+
+@attr('environment')
+def test_vector_environment_steps_all_games():
+    game = Quoridor2(board_size=9)
+    start_state = (YELLOW, 67, 13, 10, 10, frozenset())
+    states = [start_state, None]
+    env = VectorEnvironment(game, 2, start_state=lambda: states.pop())
+    assert_equal([game.initial_state(), start_state], env.states)
+    assert_equal((2, env.input_size), env.observations().shape)
+
+    masks = env.legal_masks()
+    assert_equal((2, game.all_moves), masks.shape)
+    assert_true(masks[1, game.wall_moves + DOWN])
+    values = numpy.zeros((2, game.all_moves))
+    values[:, game.wall_moves + DOWN] = 1
+    actions = env.greedy_actions(values, masks)
+    assert_equal([game.wall_moves + DOWN] * 2, list(actions))
+
+    states.append(None)
+    rewards, done = env.step(actions)
+    assert_equal([0, 1], list(rewards))
+    assert_equal([False, True], list(done))
+    assert_equal(
+        [(start_state, [actions[1]], YELLOW)],
+        env.finished,
+    )
+    assert_equal(game.initial_state(), env.states[1])
+    assert_equal(GREEN, env.players[0])
+
+
+@attr('environment')
+def test_vector_environment_step_rejects_whole_batch():
+    game = Quoridor2(board_size=9)
+    env = VectorEnvironment(game, 3)
+    states = env.states
+    actions = [game.wall_moves + DOWN, game.wall_moves + DOWN, -1]
+    assert_raises(InvalidMove, env.step, actions)
+    actions[2] = game.wall_moves + UP
+    assert_raises(InvalidMove, env.step, actions)
+    assert_equal(states, env.states)
+    assert_equal([[], [], []], [context.history for context in env.contexts])
+
+    env.step([game.wall_moves + DOWN] * 3)
+    assert_equal([[game.wall_moves + DOWN]] * 3,
+                 [context.history for context in env.contexts])
@@ -1,4 +1,5 @@
 # TODO: make test names more descriptive and apparent
+import random
 
 from nose.tools import assert_true, assert_false, assert_equal, assert_raises
 from nose.plugins.attrib import attr
@@ -12,12 +13,33 @@ from quoridor.core.game import (
     RIGHT,
     DOWN,
     LEFT,
+    SYMMETRY_FLIP,
     _make_initial_state,
     _make_blocker_positions,
     _make_goal_positions,
     _make_move_deltas,
+    _make_pawn_move_deltas,
+    _make_geometry,
+    _make_wall_points,
+    _make_wall_crossers,
+    walls_to_mask,
+    mask_to_walls,
+    mask_to_actions,
+    GameException,
     InvalidMove,
     Quoridor2,
+    BitboardQuoridor2,
+)
+from quoridor.core.distances import DistanceMap
+from quoridor.core.context import QuoridorContext
+from quoridor.core.state import MutableState
+from quoridor.core.packing import pack_states, unpack_states
+from quoridor.core.batch import batch_distances
+from quoridor.core.playout import (
+    playout,
+    PATH_POLICY,
+    RANDOM_POLICY,
+    HEURISTIC_POLICY,
 )
 
 
@@ -99,6 +121,52 @@ def test_make_move_deltas_9():
     )
 
 
+@attr('core')
+def test_make_pawn_move_deltas_9():
+    assert_equal(
+        [-9, +1, +9, -1, -18, +2, +18, -2, -8, -10, +10, +8],
+        _make_pawn_move_deltas(9)
+    )
+
+
+@attr('core', 'geometry')
+def test_make_geometry_3():
+    geometry = _make_geometry(3)
+    assert_true(geometry is _make_geometry(3))
+    assert_equal(
+        [None, 1 << 4, 1 << 0, None],
+        geometry.blocker_masks[0:4],
+    )
+    assert_equal(
+        [(0, 1), (5, 7), (2, 3), (4, 6)],
+        geometry.blocker_walls[16:20],
+    )
+    assert_equal(((1, 1 << 4), (3, 1 << 0)), geometry.neighbors[0])
+    assert_equal(
+        (
+            (1, (1 << 0) | (1 << 1)),
+            (5, (1 << 5) | (1 << 7)),
+            (7, (1 << 2) | (1 << 3)),
+            (3, (1 << 4) | (1 << 6)),
+        ),
+        geometry.neighbors[4],
+    )
+    assert_equal(
+        [False] * 6 + [True] * 3,
+        geometry.goal_flags[YELLOW],
+    )
+
+
+@attr('core')
+def test_make_wall_points_3():
+    border = 16
+    assert_equal(
+        [(border, 5, 6), (5, 6, border), (border, 9, 10), (9, 10, border),
+         (border, 5, 9), (border, 6, 10), (5, 9, border), (6, 10, border)],
+        _make_wall_points(3),
+    )
+
+
 @attr('core')
 def test_game_is_wall_crossing_9_true():
     game = Quoridor2(board_size=9)
@@ -119,7 +187,9 @@ def test_game_is_wall_crossing_9_true():
         (frozenset([44, 64 + 36, 64 + 52]), 64 + 44),
     )
     def check_true(args):
-        assert_true(game.is_wall_crossing(*args))
+        walls, wall = args
+        assert_true(game.is_wall_crossing(walls, wall))
+        assert_true(game.is_wall_crossing(walls_to_mask(walls), wall))
 
     for args in argss:
         yield check_true, args
@@ -134,7 +204,9 @@ def test_game_is_wall_crossing_9_false():
         (frozenset([10, 12, 14, 64 + 9, 64 + 27]), 45),
     )
     def check_false(args):
-        assert_false(game.is_wall_crossing(*args))
+        walls, wall = args
+        assert_false(game.is_wall_crossing(walls, wall))
+        assert_false(game.is_wall_crossing(walls_to_mask(walls), wall))
 
     for args in argss:
         yield check_false, args
@@ -295,3 +367,809 @@ def test_game_execute_action_exceptions():
         (129, 130),
         'Pawn cannot move there!'
     )
+
+
+@attr('core', 'bitboard')
+def test_walls_to_mask_and_back():
+    assert_equal(0, walls_to_mask(frozenset()))
+    assert_equal(frozenset(), mask_to_walls(0))
+    assert_equal(0b1011, walls_to_mask(frozenset([0, 1, 3])))
+    walls = frozenset([0, 5, 63, 64, 100, 127])
+    assert_equal(walls, mask_to_walls(walls_to_mask(walls)))
+
+
+@attr('core', 'bitboard')
+def test_bitboard_state_conversion():
+    game = Quoridor2(board_size=9)
+    state = (GREEN, 29, 30, 8, 9, frozenset([26, 64 + 10, 64 + 16]))
+    bitboard_state = game.to_bitboard_state(state)
+    assert_equal((GREEN, 29, 30, 8, 9, (1 << 26) | (1 << 74) | (1 << 80)),
+                 bitboard_state)
+    assert_equal(state, game.from_bitboard_state(bitboard_state))
+    assert_equal(
+        game.to_bitboard_state(game.initial_state()),
+        BitboardQuoridor2(board_size=9).initial_state()
+    )
+
+
+@attr('core', 'bitboard')
+def test_bitboard_game_is_wall_crossing():
+    game = BitboardQuoridor2(board_size=9)
+    assert_true(game.is_wall_crossing(walls_to_mask([55]), 55))
+    assert_true(game.is_wall_crossing(walls_to_mask([64 + 61]), 61))
+    assert_true(game.is_wall_crossing(walls_to_mask([4]), 5))
+    assert_true(game.is_wall_crossing(walls_to_mask([64 + 31]), 64 + 39))
+    assert_true(game.is_wall_crossing(walls_to_mask([14, 64 + 22]), 64 + 14))
+    assert_false(game.is_wall_crossing(0, 23))
+    assert_false(game.is_wall_crossing(walls_to_mask([64 + 1, 64 + 3]), 2))
+    assert_false(
+        game.is_wall_crossing(walls_to_mask([10, 12, 14, 64 + 9, 64 + 27]), 45)
+    )
+
+
+@attr('core', 'bitboard')
+def test_bitboard_game_agrees_with_set_game():
+    game = Quoridor2(board_size=9)
+    bitboard_game = BitboardQuoridor2(board_size=9)
+    states = (
+        game.initial_state(),
+        (GREEN, 29, 30, 8, 9, frozenset([26, 64 + 10, 64 + 16])),
+        (YELLOW, 40, 31, 7, 7, frozenset([31, 32, 34, 36, 38, 64 + 39])),
+        (YELLOW, 27, 62, 3, 3, frozenset((1, 3, 5, 7, 53, 55, 56, 58, 60, 62,
+                                          64, 80, 96, 110))),
+    )
+    for state in states:
+        bitboard_state = game.to_bitboard_state(state)
+        for player in (YELLOW, GREEN):
+            assert_equal(
+                game.shortest_path(state, player),
+                bitboard_game.shortest_path(bitboard_state, player),
+            )
+        assert_equal(
+            game.crossing_actions(state),
+            bitboard_game.crossing_actions(bitboard_state),
+        )
+        for move in range(12):
+            assert_equal(
+                game.is_valid_pawn_move(state, move),
+                bitboard_game.is_valid_pawn_move(bitboard_state, move),
+            )
+        for action in range(game.all_moves):
+            try:
+                new_state = game.execute_action(state, action)
+            except InvalidMove as e:
+                with assert_raises(InvalidMove) as bitboard_e:
+                    bitboard_game.execute_action(bitboard_state, action)
+                assert_equal(str(e), str(bitboard_e.exception))
+                continue
+            new_bitboard_state = bitboard_game.execute_action(
+                bitboard_state, action
+            )
+            assert_equal(
+                new_state, game.from_bitboard_state(new_bitboard_state)
+            )
+            assert_equal(
+                bitboard_state,
+                bitboard_game.undo(new_bitboard_state, action),
+            )
+
+
+@attr('core', 'distances')
+def test_game_distance_map():
+    game = Quoridor2(board_size=9)
+    state = (YELLOW, 40, 31, 7, 7, frozenset([31, 32, 34, 36, 38, 64 + 39]))
+    distances = game.distance_map(state[5], YELLOW)
+    assert_equal(81, len(distances))
+    assert_true(distances[40] is None)
+    assert_equal([4, 3, 2, 1, 0], distances[44::9])
+    assert_equal(distances, game.distance_map(walls_to_mask(state[5]), YELLOW))
+
+    distances = game.distance_map(state[5], GREEN)
+    for position in (31, 40, 0, 80, 76):
+        path = game.shortest_path(
+            state[:1 + GREEN] + (position, ) + state[3:], GREEN
+        )
+        if path is None:
+            assert_true(distances[position] is None)
+        else:
+            assert_equal(len(path) - 1, distances[position])
+    path = game.distance_path(distances, state[5], 31)
+    assert_equal(distances[31] + 1, len(path))
+    assert_equal(31, path[-1])
+    assert_true(path[0] in game.goal_positions[GREEN])
+
+
+@attr('core', 'distances')
+def test_distance_map_follows_walls():
+    game = Quoridor2(board_size=9)
+    placed = []
+    distance_maps = [DistanceMap(game, frozenset(), color)
+                     for color in (YELLOW, GREEN)]
+    assert_equal(range(8, -1, -1), distance_maps[YELLOW].distances[::9])
+    assert_equal(range(9), distance_maps[GREEN].distances[::9])
+
+    # box in the square 40 and open it again wall by wall
+    for wall in (27, 35, 64 + 27, 64 + 36, 28, 36, 64 + 28, 64 + 29, 37):
+        placed.append(wall)
+        for color, distance_map in enumerate(distance_maps):
+            distance_map.place_wall(wall)
+            assert_equal(
+                game.distance_map(frozenset(placed), color),
+                distance_map.distances,
+            )
+    while placed:
+        wall = placed.pop(0)
+        for color, distance_map in enumerate(distance_maps):
+            distance_map.remove_wall(wall)
+            assert_equal(
+                game.distance_map(frozenset(placed), color),
+                distance_map.distances,
+            )
+
+
+@attr('core', 'distances')
+def test_distance_map_path():
+    game = Quoridor2(board_size=9)
+    state = (YELLOW, 40, 31, 7, 7, frozenset([31, 32, 34, 36, 38, 64 + 39]))
+    distance_map = DistanceMap(game, state[5], YELLOW)
+    assert_true(distance_map[40] is None)
+    assert_true(distance_map.path(40) is None)
+
+    distance_map = DistanceMap(game, state[5], GREEN)
+    path = distance_map.path(31)
+    assert_equal(len(game.shortest_path(state, GREEN)), len(path))
+    assert_equal(31, path[-1])
+    assert_true(path[0] in game.goal_positions[GREEN])
+
+
+@attr('core', 'context')
+def test_context_update_and_undo_wall():
+    game = Quoridor2(board_size=9)
+    context = QuoridorContext(game)
+    context.reset()
+
+    def check_paths():
+        for color in (YELLOW, GREEN):
+            assert_equal(
+                len(game.shortest_path(context.state, color)),
+                len(context[color]['path']),
+            )
+            assert_equal(
+                game.distance_map(context.state[5], color),
+                context[color]['distances'].distances,
+            )
+
+    for action in (3, 64 + 60, 59, 131, 64 + 2, 64 + 57):
+        context.update(action)
+        check_paths()
+    assert_equal(10, len(context[YELLOW]['path']))
+    assert_equal(10, len(context[GREEN]['path']))
+
+    while context.history:
+        context.undo()
+        check_paths()
+    assert_equal(game.initial_state(), context.state)
+
+
+@attr('core', 'context')
+def test_context_queued_walls():
+    game = Quoridor2(board_size=9)
+    context = QuoridorContext(game)
+    context.reset()
+    rng = random.Random(11)
+    for i in range(400):
+        if context.is_terminal or (context.history and rng.random() < 0.3):
+            context.undo()
+        else:
+            context.update(rng.choice(mask_to_actions(context.legal_actions)))
+        for color in (YELLOW, GREEN):
+            path = context[color].path
+            assert_equal(len(game.shortest_path(context.state, color)),
+                         len(path))
+            assert_equal(context.state[1 + color], path[-1])
+            if rng.random() < 0.1:
+                assert_equal(
+                    game.distance_map(context.state[5], color),
+                    context[color].distances.distances,
+                )
+
+
+@attr('core', 'context')
+def test_context_undo_restores_snapshot():
+    game = Quoridor2(board_size=9)
+    context = QuoridorContext(game)
+    context.reset()
+    rng = random.Random(5)
+
+    def snapshot():
+        return (context.state, context.key, context.blocked) + tuple(
+            (list(record.path), set(record.blockers), set(record.goal_cut),
+             list(record.distances.distances))
+            for record in (context.yellow, context.green)
+        )
+
+    snapshots = []
+    while not context.is_terminal:
+        snapshots.append(snapshot())
+        actions = mask_to_actions(game.legal_actions(context.state))
+        context.update(rng.choice(actions))
+    assert_true(len(snapshots) > 20)
+    while snapshots:
+        context.undo()
+        assert_equal(snapshots.pop(), snapshot())
+    assert_raises(InvalidMove, context.undo)
+
+
+@attr('core', 'context', 'fork')
+def test_context_fork():
+    game = Quoridor2(board_size=9)
+    context = QuoridorContext(game)
+    context.reset()
+    for action in (20, 64 + 60, 130, 59, 130):
+        context.update(action)
+
+    def snapshot(context):
+        return (context.state, context.key, context.blocked,
+                list(context.history)) + tuple(
+            (list(record.path), set(record.blockers),
+             list(record.distances.distances))
+            for record in (context.yellow, context.green)
+        )
+
+    expected = snapshot(context)
+    goal_cuts = [set(context.yellow.goal_cut), set(context.green.goal_cut)]
+    rng = random.Random(11)
+    for i in range(5):
+        fork = context.fork()
+        assert_equal(expected, snapshot(fork))
+        while not fork.is_terminal:
+            fork.update(rng.choice(mask_to_actions(fork.legal_actions)))
+            fresh = QuoridorContext(game)
+            fresh.reset(fork.state)
+            for color in (YELLOW, GREEN):
+                assert_equal(fresh[color].distances.distances,
+                             fork[color].distances.distances)
+        assert_equal(expected, snapshot(context))
+        assert_equal(goal_cuts, [context.yellow.goal_cut,
+                                 context.green.goal_cut])
+        while len(fork.history) > len(context.history):
+            fork.undo()
+        assert_equal(expected, snapshot(fork))
+        assert_raises(InvalidMove, fork.undo)
+    context.update(8)
+    while context.history:
+        context.undo()
+    assert_equal(game.initial_state(), context.state)
+
+
+@attr('core', 'context', 'goal_cut')
+def test_context_goal_cut_kept_after_pawn_moves():
+    game = Quoridor2(board_size=9)
+    context = QuoridorContext(game)
+    rng = random.Random(3)
+    kept = 0
+    for i in range(20):
+        context.reset()
+        while not context.is_terminal:
+            legal = mask_to_actions(context.legal_actions)
+            record = context.current
+            goal_cut = set(record.goal_cut)
+            pawn_moves = [action for action in legal
+                          if action >= game.wall_moves]
+            if rng.random() < 0.7:
+                context.update(rng.choice(pawn_moves))
+                kept += len(goal_cut & record.goal_cut)
+            else:
+                context.update(rng.choice(legal))
+
+            walls = context.yellow.distances.walls
+            for record in (context.yellow, context.green):
+                position = context.state[1 + record.color]
+                for wall in record.goal_cut:
+                    if not context.blocked >> wall & 1:
+                        assert_false(game.can_reach_goal(
+                            walls | 1 << wall, record.color, position
+                        ))
+    assert_true(kept > 0)
+
+
+@attr('core', 'context', 'legal')
+def test_context_legal_actions():
+    game = Quoridor2(board_size=9)
+    context = QuoridorContext(game)
+    context.reset()
+    rng = random.Random(7)
+    for i in range(300):
+        if context.is_terminal:
+            context.reset()
+        assert_equal(game.legal_actions(context.state), context.legal_actions)
+        if context.history and rng.random() < 0.2:
+            context.undo()
+        else:
+            context.update(rng.choice(mask_to_actions(context.legal_actions)))
+    for action in context.invalid_actions:
+        assert_raises(InvalidMove, game.execute_action, context.state, action)
+
+    context.legal_actions
+    assert_raises(InvalidMove, context.update, -1)
+    assert_raises(InvalidMove, context.update, game.all_moves)
+
+
+@attr('core', 'components')
+def test_game_closes_wall_loop():
+    game = Quoridor2(board_size=9)
+    for wall in range(game.wall_moves):
+        assert_false(game.closes_wall_loop(frozenset(), wall))
+    assert_false(game.closes_wall_loop(frozenset([0]), 2))
+    assert_true(game.closes_wall_loop(frozenset([0]), 64 + 1))
+    assert_true(game.closes_wall_loop(frozenset([0, 2]), 64 + 3))
+    assert_false(game.closes_wall_loop(frozenset([10, 64 + 2]), 12))
+
+    walls = frozenset((1, 3, 5, 7, 53, 55, 56, 58, 60, 62, 64, 80, 96, 110))
+    for wall in (8, 24, 39, 40, 47, 112, 116, 125, 127):
+        assert_true(game.closes_wall_loop(walls, wall))
+
+
+@attr('core', 'legal_actions')
+def test_game_legal_actions():
+    game = Quoridor2(board_size=9)
+    state = game.initial_state()
+    legal = game.legal_actions(state)
+    assert_equal(
+        range(game.wall_moves) + [game.wall_moves + m for m in (1, 2, 3)],
+        mask_to_actions(legal),
+    )
+
+    walls = frozenset(
+        (3, 13, 27, 53, 55, 78, 81, 93, 98, 104, 114, 120, 123, 124)
+    )
+    for state in ((YELLOW, 4, 76, 3, 3, walls), (GREEN, 31, 40, 0, 4, walls),
+                  (YELLOW, 40, 49, 10, 10, frozenset([31, 32, 101]))):
+        legal = game.legal_actions(state)
+        for action in game.all_actions:
+            if legal >> action & 1:
+                game.execute_action(state, action)
+            else:
+                assert_raises(
+                    GameException, game.execute_action, state, action
+                )
+
+    assert_equal(0, game.legal_actions((GREEN, 76, 40, 10, 10, frozenset())))
+
+
+@attr('core', 'zobrist')
+def test_game_state_key():
+    game = Quoridor2(board_size=9)
+    state = game.initial_state()
+    assert_equal(game.state_key(state), Quoridor2().state_key(state))
+    assert_equal(
+        game.state_key(state),
+        game.state_key(game.to_bitboard_state(state)),
+    )
+    for action in (game.wall_moves + DOWN, 10, 64 + 30, game.wall_moves):
+        key = game.state_key(state)
+        delta = game.key_delta(state, action)
+        new_state = game.execute_action(state, action)
+        assert_equal(game.state_key(new_state), key ^ delta)
+        assert_equal(delta, game.key_delta(game.undo(new_state, action),
+                                           action))
+        state = new_state
+    assert_raises(InvalidMove, game.key_delta, game.initial_state(),
+                  game.wall_moves + UP)
+
+
+@attr('core', 'context', 'zobrist')
+def test_context_key_3():
+    game = Quoridor2(board_size=3)
+    context = QuoridorContext(game)
+    context.reset()
+    assert_equal(game.state_key(game.initial_state()), context.key)
+    rng = random.Random(3)
+    keys = []
+    while not context.is_terminal:
+        keys.append(context.key)
+        context.update(rng.choice(mask_to_actions(context.legal_actions)))
+        assert_equal(game.state_key(context.state), context.key)
+    while keys:
+        context.undo()
+        assert_equal(keys.pop(), context.key)
+        assert_equal(game.state_key(context.state), context.key)
+
+
+@attr('core', 'context', 'zobrist')
+def test_context_key():
+    game = Quoridor2(board_size=9)
+    context = QuoridorContext(game)
+    context.reset()
+    start_key = context.key
+    for action in (game.wall_moves + DOWN, 10, 64 + 30, game.wall_moves):
+        context.update(action)
+        assert_equal(game.state_key(context.state), context.key)
+    while context.history:
+        context.undo()
+        assert_equal(game.state_key(context.state), context.key)
+    assert_equal(start_key, context.key)
+
+
+@attr('core', 'path_cache')
+def test_game_path_cache():
+    game = Quoridor2(board_size=9)
+    state = (YELLOW, 40, 49, 10, 10, frozenset([31, 32, 101]))
+    expected = game.shortest_path(state, YELLOW)
+    cache = game.enable_path_cache(limit=2)
+
+    path = game.shortest_path(state, YELLOW)
+    assert_equal(expected, path)
+    assert_equal((0, 1), (cache.hits, cache.misses))
+    path.pop()
+    assert_equal(expected, game.shortest_path(state, YELLOW))
+    assert_equal((1, 1), (cache.hits, cache.misses))
+
+    game.shortest_path(state, YELLOW, avoid=set([expected[0]]))
+    game.shortest_path(state, GREEN)
+    assert_equal(2, len(cache))
+    game.shortest_path(state, YELLOW)
+    assert_equal((1, 4), (cache.hits, cache.misses))
+
+    cache.clear()
+    assert_equal(0, len(cache))
+    game.disable_path_cache()
+    assert_equal(expected, game.shortest_path(state, YELLOW))
+    assert_equal((1, 4), (cache.hits, cache.misses))
+
+
+@attr('core', 'mutable_state')
+def test_mutable_state_make_unmake():
+    game = Quoridor2(board_size=9)
+    mutable = MutableState(game)
+    states = [game.initial_state()]
+    for action in (game.wall_moves + DOWN, 10, 64 + 30, game.wall_moves):
+        mutable.make(action)
+        states.append(game.execute_action(states[-1], action))
+        assert_equal(states[-1], mutable.to_state())
+        assert_equal(game.state_key(states[-1]), mutable.key)
+
+    assert_equal(
+        [game.wall_moves + DOWN, 10, 64 + 30, game.wall_moves],
+        mutable.history,
+    )
+    values = list(mutable.values)
+    assert_raises(InvalidMove, mutable.make, 10)
+    assert_raises(InvalidMove, mutable.make, 64 + 10)
+    assert_raises(InvalidMove, mutable.make, game.wall_moves + LEFT + 4)
+    assert_equal(values, mutable.values)
+
+    while len(states) > 1:
+        mutable.unmake()
+        states.pop()
+        assert_equal(states[-1], mutable.to_state())
+        assert_equal(game.state_key(states[-1]), mutable.key)
+    assert_raises(InvalidMove, mutable.unmake)
+
+
+@attr('core', 'mutable_state')
+def test_mutable_state_values_in_read_only_methods():
+    game = Quoridor2(board_size=9)
+    mutable = MutableState(game)
+    for action in (game.wall_moves + DOWN, 10, 64 + 30, 44):
+        mutable.make(action)
+    state = mutable.to_state()
+    values = mutable.values
+    walls = values[5]
+
+    assert_equal(game.legal_actions(state), game.legal_actions(values))
+    assert_equal(game.state_key(state), game.state_key(values))
+    for wall in (10, 11, 64 + 10, 64 + 30, 64 + 38, 44, 45, 5):
+        assert_equal(
+            game.is_wall_crossing(state[5], wall),
+            game.is_wall_crossing(walls, wall),
+        )
+    assert_equal(game.crossing_mask(state[5]), game.crossing_mask(walls))
+    for player in (YELLOW, GREEN):
+        position = values[1 + player]
+        assert_equal(
+            game.shortest_path(state, player),
+            game.shortest_path(values, player),
+        )
+        assert_equal(
+            game.pawn_path(state, player),
+            game.pawn_path(values, player),
+        )
+        assert_equal(
+            game.distance_map(state[5], player),
+            game.distance_map(walls, player),
+        )
+        assert_equal(
+            game.can_reach_goal(state[5], player, position),
+            game.can_reach_goal(walls, player, position),
+        )
+
+
+@attr('core', 'mutable_state')
+def test_game_check_wall_paths():
+    game = Quoridor2(board_size=9)
+    walls = (1, 3, 5, 7, 53, 55, 56, 58, 60, 62, 64, 80, 96, 110)
+    state = (YELLOW, 27, 62, 3, 3, frozenset(walls))
+    mutable = MutableState(game, state)
+    for wall in (8, 24, 39, 40, 47, 112, 116, 125, 127):
+        assert_raises(InvalidMove, game.check_wall_paths, state, wall)
+        assert_raises(InvalidMove, game.check_wall_paths, mutable.values,
+                      wall)
+        assert_raises(InvalidMove, mutable.make, wall)
+    game.check_wall_paths(state, 20)
+    game.check_wall_paths(mutable.values, 20)
+    assert_equal(mutable.to_state(), state)
+
+
+@attr('core', 'packing')
+def test_game_pack_unpack():
+    game = Quoridor2(board_size=9)
+    state = (GREEN, 4, 76, 3, 2, frozenset([1, 64, 127]))
+    packed = game.pack(state)
+    assert_equal(21, len(packed))
+    assert_equal(
+        bytearray([1, 4, 76, 3, 2, 64] + [0] * 7 + [128] + [0] * 6 + [1]),
+        bytearray(packed),
+    )
+    assert_equal(state, game.unpack(packed))
+    assert_equal(game.initial_state(), game.unpack(
+        game.pack(game.initial_state())
+    ))
+    assert_raises(GameException, game.unpack, packed[:-1])
+
+    bitboard_game = BitboardQuoridor2(board_size=9)
+    bitboard_state = game.to_bitboard_state(state)
+    assert_equal(packed, bitboard_game.pack(bitboard_state))
+    assert_equal(bitboard_state, bitboard_game.unpack(packed))
+
+
+@attr('core', 'packing')
+def test_pack_unpack_states():
+    game = Quoridor2(board_size=9)
+    states = [
+        game.initial_state(),
+        (GREEN, 4, 76, 3, 2, frozenset([1, 64, 127])),
+        (YELLOW, 40, 49, 10, 10, frozenset([31, 32, 101])),
+    ]
+    packed = pack_states(game, states)
+    assert_equal((3, game.packed_size), packed.shape)
+    for row, state in zip(packed, states):
+        assert_equal(bytearray(game.pack(state)), bytearray(row.tolist()))
+    assert_equal(states, unpack_states(game, packed))
+    assert_equal([], unpack_states(game, pack_states(game, [])))
+
+
+@attr('core', 'crossers')
+def test_make_wall_crossers_3():
+    assert_equal([
+        frozenset([0, 1, 4]),
+        frozenset([0, 1, 5]),
+        frozenset([2, 3, 6]),
+        frozenset([2, 3, 7]),
+        frozenset([0, 4, 6]),
+        frozenset([1, 5, 7]),
+        frozenset([2, 4, 6]),
+        frozenset([3, 5, 7]),
+    ], _make_wall_crossers(3))
+
+
+@attr('core', 'context', 'crossers')
+def test_context_blocked_mask():
+    game = Quoridor2(board_size=9)
+    context = QuoridorContext(game)
+    context.reset()
+    assert_equal(0, context['blocked'])
+    for action in (10, 64 + 20, 12, 64 + 30):
+        context.update(action)
+        assert_equal(game.crossing_mask(context.state[5]), context['blocked'])
+    assert_true(context['blocked'] >> 11 & 1)
+    while context.history:
+        context.undo()
+        assert_equal(game.crossing_mask(context.state[5]), context['blocked'])
+
+
+@attr('core', 'context')
+def test_context_item_access():
+    game = Quoridor2(board_size=9)
+    context = QuoridorContext(game)
+    context.reset(players={YELLOW: {'name': 'path'}, GREEN: {}})
+    assert_false(hasattr(context, '__dict__'))
+    assert_false(hasattr(context[YELLOW], '__dict__'))
+    assert_equal('path', context[YELLOW]['name'])
+    assert_equal(context.yellow.path, context[YELLOW]['path'])
+    assert_equal(GREEN, context[GREEN]['color'])
+    assert_equal(context.start_state, context['start_state'])
+    context[GREEN]['name'] = 'heuristic'
+    assert_equal('heuristic', context.green.name)
+    assert_raises(KeyError, lambda: context['_players'])
+    assert_raises(KeyError, lambda: context[YELLOW]['unknown'])
+    assert_raises(KeyError, lambda: context[YELLOW]['_pending'])
+    assert_raises(KeyError, lambda: context[YELLOW][0])
+    assert_equal(context.yellow.distances, context[YELLOW]['distances'])
+
+
+@attr('core', 'symmetry')
+def test_game_canonicalize():
+    game = Quoridor2(board_size=9)
+    state = (YELLOW, 3, 76, 9, 10, frozenset([0, 64 + 9]))
+    mirrored = (YELLOW, 5, 76, 9, 10, frozenset([7, 64 + 14]))
+    flipped = (GREEN, 4, 75, 10, 9, frozenset([56, 64 + 49]))
+    canonical, actions = game.canonicalize(state)
+    assert_equal(state, canonical)
+    assert_equal(range(game.all_moves), actions)
+
+    canonical, actions = game.canonicalize(mirrored)
+    assert_equal(state, canonical)
+    assert_equal(0, actions[7])
+    assert_equal(64 + 9, actions[64 + 14])
+    assert_equal(game.wall_moves + LEFT, actions[game.wall_moves + RIGHT])
+
+    canonical, actions = game.canonicalize(flipped)
+    assert_equal(state, canonical)
+    assert_equal(0, actions[56])
+    assert_equal(game.wall_moves + DOWN, actions[game.wall_moves + UP])
+    new_state = game.execute_action(flipped, game.wall_moves + UP)
+    assert_equal(
+        game.execute_action(state, actions[game.wall_moves + UP]),
+        game.transform_state(new_state, SYMMETRY_FLIP),
+    )
+
+    context = QuoridorContext(game)
+    context.reset(state=flipped)
+    assert_equal(state, context.canonical[0])
+
+
+@attr('core', 'pawn_moves')
+def test_game_pawn_moves_mask():
+    game = Quoridor2(board_size=9)
+    walls = walls_to_mask([31, 64 + 39])
+    for position, other_position in ((40, 49), (40, 31), (4, 76), (0, 1),
+                                     (8, 9), (44, 43), (36, 37)):
+        expected = 0
+        for move in range(12):
+            if game.pawn_move_target(walls, position, other_position,
+                                     move) is not None:
+                expected |= 1 << move
+        assert_equal(
+            expected, game.pawn_moves_mask(walls, position, other_position)
+        )
+
+    moves = (1 << RIGHT) | (1 << LEFT) | (1 << DOWN)
+    assert_equal(moves, game.pawn_moves_mask(0, 4, 76))
+    moves = (1 << UP) | (1 << RIGHT) | (1 << LEFT) | (1 << 6) | (
+        (1 << 10) | (1 << 11))
+    assert_equal(moves, game.pawn_moves_mask(0, 40, 49))
+    walls = walls_to_mask([44])
+    assert_equal(moves & ~(1 << 6), game.pawn_moves_mask(walls, 40, 49))
+
+
+@attr('core', 'reachability')
+def test_game_can_reach_goal():
+    game = Quoridor2(board_size=9)
+    walls = frozenset([0, 2, 4, 6, 15, 64 + 7])  # top row cut off
+    assert_false(game.can_reach_goal(walls, GREEN, 76))
+    assert_false(game.can_reach_goal(walls, YELLOW, 4))
+    assert_true(game.can_reach_goal(walls, GREEN, 17))
+    assert_true(game.can_reach_goal(walls, YELLOW, 40))
+    assert_false(game.players_can_reach_goal((YELLOW, 4, 17, 5, 5, walls)))
+    assert_false(game.players_can_reach_goal((YELLOW, 40, 76, 5, 5, walls)))
+    assert_true(game.players_can_reach_goal((YELLOW, 40, 17, 5, 5, walls)))
+    assert_true(game.players_can_reach_goal(game.initial_state()))
+
+
+@attr('core', 'astar')
+def test_game_astar_path():
+    game = Quoridor2(board_size=9)
+    walls = frozenset(
+        (3, 13, 27, 53, 55, 78, 81, 93, 98, 104, 114, 120, 123, 124)
+    )
+    for state in (game.initial_state(), (YELLOW, 4, 76, 3, 3, walls),
+                  (GREEN, 31, 40, 0, 4, walls),
+                  (YELLOW, 40, 49, 10, 10, frozenset([31, 32, 101]))):
+        for player in (YELLOW, GREEN):
+            path = game.shortest_path(state, player)
+            assert_equal(path, game.astar_path(state, player))
+            avoid = set([path[0]])
+            assert_equal(
+                game.shortest_path(state, player, avoid),
+                game.astar_path(state, player, avoid),
+            )
+            assert_equal(
+                len(path), len(game.astar_path(state, player, exact=False))
+            )
+
+    walls = frozenset([0, 2, 4, 6, 15, 64 + 7])
+    assert_equal(None, game.astar_path((YELLOW, 4, 76, 5, 5, walls), YELLOW))
+
+
+@attr('core', 'pawn_path')
+def test_game_pawn_path():
+    game = Quoridor2(board_size=9)
+    state = game.initial_state()
+    assert_equal(8, game.pawn_distance(state, YELLOW))
+    assert_equal(8, game.pawn_distance(state, GREEN))
+
+    state = (YELLOW, 31, 40, 10, 10, frozenset())
+    assert_equal([76, 67, 58, 49, 31], game.pawn_path(state, YELLOW))
+    assert_equal(4, game.pawn_distance(state, YELLOW))
+    assert_equal(3, game.pawn_distance(state, GREEN))
+
+    walls = frozenset([35])    # no jump over the pawn at 40, sidestep
+    state = (YELLOW, 31, 40, 10, 10, walls)
+    path = game.pawn_path(state, YELLOW)
+    assert_equal(5, game.pawn_distance(state, YELLOW))
+    assert_true(path[-2] in (39, 41))
+
+    walls = frozenset([0, 2, 4, 6, 15, 64 + 7])
+    assert_equal(None, game.pawn_path((YELLOW, 4, 76, 5, 5, walls), YELLOW))
+    assert_equal(0, game.pawn_distance((GREEN, 76, 4, 5, 5, walls), GREEN))
+
+
+@attr('core', 'wall_impacts')
+def test_game_wall_impacts():
+    game = Quoridor2(board_size=9)
+    state = (YELLOW, 4, 76, 5, 5, frozenset([0, 2, 4, 15, 64 + 7]))
+    impacts = game.wall_impacts(state)
+    legal = game.legal_actions(state)
+    assert_equal(game.crossing_mask(state[5]) ^ ((1 << game.wall_moves) - 1),
+                 sum(1 << wall for wall in impacts))
+    for wall, impact in impacts.items():
+        new_state = state[:5] + (state[5].union([wall]), )
+        distances = []
+        for player in (YELLOW, GREEN):
+            path = game.shortest_path(new_state, player)
+            distances.append(None if path is None else len(path) - 1)
+        assert_equal((distances[0], distances[1], None in distances), impact)
+        assert_equal(not impact.disconnected, bool(legal >> wall & 1))
+    assert_true(impacts[6].disconnected)
+    assert_equal((10, 10, False), impacts[70])
+    assert_equal((11, 10, False), impacts[22])
+
+    assert_equal({}, game.wall_impacts((YELLOW, 4, 76, 0, 5, frozenset())))
+
+
+@attr('core', 'batch')
+def test_batch_distances():
+    game = Quoridor2(board_size=9)
+    states = [
+        game.initial_state(),
+        (YELLOW, 4, 76, 5, 5, frozenset([0, 2, 4, 15, 64 + 7])),
+        (YELLOW, 4, 76, 5, 5, frozenset([0, 2, 4, 6, 15, 64 + 7])),
+        (GREEN, 40, 2, 10, 10, frozenset([31, 32, 101])),
+        (YELLOW, 73, 17, 3, 3, frozenset()),
+    ]
+    expected = []
+    for state in states:
+        expected.append([])
+        for player in (YELLOW, GREEN):
+            path = game.shortest_path(state, player)
+            expected[-1].append(-1 if path is None else len(path) - 1)
+    assert_equal(
+        expected, batch_distances(game, pack_states(game, states)).tolist()
+    )
+    assert_equal((0, 2), batch_distances(game, pack_states(game, [])).shape)
+
+
+@attr('core', 'playout')
+def test_playout():
+    game = Quoridor2(board_size=9)
+    assert_equal((YELLOW, 1), playout(game, (YELLOW, 67, 13, 10, 10,
+                                             frozenset())))
+    assert_equal((GREEN, 0), playout(game, (YELLOW, 67, 4, 10, 10,
+                                            frozenset())))
+    assert_equal((None, 3), playout(game, game.initial_state(), max_moves=3))
+
+    for policy in (PATH_POLICY, RANDOM_POLICY, HEURISTIC_POLICY):
+        for seed in range(5):
+            actions = []
+            winner, moves = playout(game, game.initial_state(), policy,
+                                    rng=random.Random(seed), actions=actions)
+            assert_equal(moves, len(actions))
+            state = game.initial_state()
+            for action in actions:
+                assert_false(game.is_terminal(state))
+                state = game.execute_action(state, action)
+            if winner is None:
+                assert_false(game.is_terminal(state))
+            else:
+                assert_true(state[1 + winner] in game.goal_positions[winner])